@@ -0,0 +1,133 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from ecdsa import SigningKey, SECP256k1
+
+from main import Block, BlockStore, Transaction, _hash_nonce
+
+
+# ==============================
+# Подготовка синтетической нагрузки
+# ==============================
+def make_signed_transactions(count: int, senders: int) -> list:
+    keys = [SigningKey.generate(curve=SECP256k1) for _ in range(senders)]
+    items = []
+    for i in range(count):
+        private_key = keys[i % senders]
+        tx = Transaction(f"sender{i % senders}", f"recipient{i}", float(i % 100 + 1))
+        items.append((tx.to_dict(), tx.sign_transaction(private_key), private_key.get_verifying_key()))
+    return items
+
+
+def make_blocks(count: int, transactions: int, hash_format: str) -> list:
+    blocks = []
+    previous_hash = "0"
+    for index in range(count):
+        txs = [
+            Transaction(f"sender{i % 50}", f"recipient{i}", i % 1000 + 0.25, fee=0.01, nonce=index * transactions + i)
+            for i in range(transactions)
+        ]
+        block = Block(index, previous_hash, 1_700_000_000.0 + index, txs, hash_format=hash_format)
+        blocks.append(block)
+        previous_hash = block.hash
+    return blocks
+
+
+def _timed(func, repeat: int = 1) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+# ==============================
+# Бенчмарки
+# ==============================
+def bench_verify(args) -> None:
+    items = make_signed_transactions(args.count, args.senders)
+    print(f"[Бенчмарк] Проверка {args.count} подписей от {args.senders} отправителей")
+
+    started = time.perf_counter()
+    serial = [Transaction.verify_transaction(tx_dict, sig, key) for tx_dict, sig, key in items]
+    serial_time = time.perf_counter() - started
+    print(f"  verify_transaction (последовательно): {args.count / serial_time:10.1f} подписей/с")
+
+    for processes in sorted({1, args.processes}):
+        started = time.perf_counter()
+        batch = Transaction.verify_batch(items, processes=processes)
+        batch_time = time.perf_counter() - started
+        assert batch == serial, "Результаты пакетной проверки расходятся с последовательной"
+        print(f"  verify_batch (процессов: {processes}): {args.count / batch_time:10.1f} подписей/с "
+              f"(x{serial_time / batch_time:.2f})")
+
+
+def bench_serialize(args) -> None:
+    json_blocks = make_blocks(args.blocks, args.transactions, "json")
+    binary_blocks = make_blocks(args.blocks, args.transactions, "binary")
+    print(f"[Бенчмарк] {args.blocks} блоков по {args.transactions} транзакций")
+
+    json_encoded = [json.dumps(b.to_dict(), sort_keys=True).encode() for b in json_blocks]
+    binary_encoded = [b.to_bytes() for b in binary_blocks]
+    rows = [
+        ("кодирование", _timed(lambda: [json.dumps(b.to_dict(), sort_keys=True).encode() for b in json_blocks]),
+         _timed(lambda: [b.to_bytes() for b in binary_blocks])),
+        ("декодирование", _timed(lambda: [Block.from_dict(json.loads(d)) for d in json_encoded]),
+         _timed(lambda: [Block.from_bytes(d) for d in binary_encoded])),
+    ]
+    for name, json_time, binary_time in rows:
+        print(f"  {name:15}: JSON {json_time * 1000:8.1f} мс | binary {binary_time * 1000:8.1f} мс "
+              f"(x{json_time / binary_time:.2f})")
+
+    json_size = sum(len(d) for d in json_encoded)
+    binary_size = sum(len(d) for d in binary_encoded)
+    print(f"  размер в сети  : JSON {json_size:10d} Б | binary {binary_size:10d} Б (x{json_size / binary_size:.2f})")
+
+    tx = json_blocks[0].transactions[0]
+    print(f"  транзакция     : JSON {len(json.dumps(tx.to_dict(), sort_keys=True))} Б | binary {len(tx.to_bytes())} Б")
+
+    with tempfile.TemporaryDirectory() as directory:
+        sizes = {}
+        for name, blocks in (("json", json_blocks), ("binary", binary_blocks)):
+            store = BlockStore(os.path.join(directory, name))
+            for block in blocks:
+                store.append(block)
+            store.close()
+            sizes[name] = os.path.getsize(os.path.join(directory, name, "blocks.dat"))
+    print(f"  размер на диске: JSON {sizes['json']:10d} Б | binary {sizes['binary']:10d} Б "
+          f"(x{sizes['json'] / sizes['binary']:.2f})")
+
+    tries = args.hashes
+    for name, block in (("JSON", json_blocks[-1]), ("binary", binary_blocks[-1])):
+        prefix, suffix = block.hash_template()
+        midstate = hashlib.sha256(prefix)
+        binary = block.hash_format == "binary"
+        elapsed = _timed(lambda: [_hash_nonce(midstate, nonce, suffix, binary) for nonce in range(tries)])
+        print(f"  майнинг {name:7}: {tries / elapsed:12.0f} хешей/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки блокчейна PoW")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    verify_parser = subparsers.add_parser("verify", help="пакетная проверка подписей")
+    verify_parser.add_argument("--count", type=int, default=2000)
+    verify_parser.add_argument("--senders", type=int, default=20)
+    verify_parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    verify_parser.set_defaults(func=bench_verify)
+
+    serialize_parser = subparsers.add_parser("serialize", help="JSON против бинарного формата блоков")
+    serialize_parser.add_argument("--blocks", type=int, default=200)
+    serialize_parser.add_argument("--transactions", type=int, default=100)
+    serialize_parser.add_argument("--hashes", type=int, default=200000)
+    serialize_parser.set_defaults(func=bench_serialize)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
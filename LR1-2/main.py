@@ -1,44 +1,300 @@
+import asyncio
+import atexit
+import bisect
 import hashlib
+import heapq
+import itertools
 import json
+import mmap
+import os
+import random
+import struct
+import threading
 import time
 import tkinter as tk
-from collections import OrderedDict
-from multiprocessing import Process
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from multiprocessing import Pool, Process, Value
 from tkinter import messagebox
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 
-from ecdsa import SigningKey, VerifyingKey, SECP256k1
+from ecdsa import BadSignatureError, SigningKey, VerifyingKey, SECP256k1
+from ecdsa.ellipticcurve import PointJacobi
+
+
+# ==============================
+# Компактная бинарная сериализация
+# ==============================
+# Суммы хранятся в фиксированной точке (8 знаков), целые — фиксированной ширины,
+# строки — с префиксом длины. Порядок байт сетевой.
+AMOUNT_SCALE = 10 ** 8
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+_TX_HAS_FEE = 1
+_TX_HAS_NONCE = 2
+BINARY_BLOCK_MARKER = b'\x01'
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    return _U16.pack(len(data)) + data
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = _U16.unpack_from(data, offset)
+    offset += _U16.size
+    return data[offset:offset + length].decode(), offset + length
+
+
+def _pack_amount(amount: float) -> bytes:
+    return _I64.pack(round(amount * AMOUNT_SCALE))
+
+
+def _unpack_amount(data: bytes, offset: int) -> Tuple[float, int]:
+    return _I64.unpack_from(data, offset)[0] / AMOUNT_SCALE, offset + _I64.size
 
 
 # ==============================
 # Класс Transaction — транзакция
 # ==============================
 class Transaction:
-    def __init__(self, sender: str, recipient: str, amount: float):
+    def __init__(
+        self,
+        sender: str,
+        recipient: str,
+        amount: float,
+        fee: float = 0.0,
+        nonce: Optional[int] = None
+    ):
         self.sender = sender
         self.recipient = recipient
         self.amount = amount
+        self.fee = fee
+        self.nonce = nonce
 
     def to_dict(self) -> Dict[str, Any]:
-        return OrderedDict({
+        data = OrderedDict({
             'sender': self.sender,
             'recipient': self.recipient,
             'amount': self.amount
         })
+        # Необязательные поля попадают в подпись и хеш только если заданы,
+        # чтобы старые транзакции сериализовались как раньше
+        if self.fee:
+            data['fee'] = self.fee
+        if self.nonce is not None:
+            data['nonce'] = self.nonce
+        return data
+
+    @staticmethod
+    def from_dict(data: dict) -> "Transaction":
+        return Transaction(data['sender'], data['recipient'], data['amount'], data.get('fee', 0.0), data.get('nonce'))
 
-    def sign_transaction(self, private_key: SigningKey) -> bytes:
+    def to_bytes(self) -> bytes:
+        flags = (_TX_HAS_FEE if self.fee else 0) | (_TX_HAS_NONCE if self.nonce is not None else 0)
+        parts = [_U8.pack(flags), _pack_str(self.sender), _pack_str(self.recipient), _pack_amount(self.amount)]
+        if self.fee:
+            parts.append(_pack_amount(self.fee))
+        if self.nonce is not None:
+            parts.append(_U64.pack(self.nonce))
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Transaction":
+        return Transaction.decode(data, 0)[0]
+
+    @staticmethod
+    def decode(data: bytes, offset: int) -> Tuple["Transaction", int]:
+        """Читает транзакцию с позиции offset; возвращает её и позицию за ней"""
+        (flags,) = _U8.unpack_from(data, offset)
+        sender, offset = _unpack_str(data, offset + _U8.size)
+        recipient, offset = _unpack_str(data, offset)
+        amount, offset = _unpack_amount(data, offset)
+        fee, nonce = 0.0, None
+        if flags & _TX_HAS_FEE:
+            fee, offset = _unpack_amount(data, offset)
+        if flags & _TX_HAS_NONCE:
+            (nonce,) = _U64.unpack_from(data, offset)
+            offset += _U64.size
+        return Transaction(sender, recipient, amount, fee, nonce), offset
+
+    def tx_id(self) -> str:
+        return merkle_leaf(self.to_dict())
+
+    def sign_transaction(self, private_key: SigningKey, binary: bool = False) -> bytes:
+        if binary:
+            return private_key.sign(self.to_bytes())
         transaction_data = json.dumps(self.to_dict(), sort_keys=True)
         return private_key.sign(transaction_data.encode())
 
     @staticmethod
-    def verify_transaction(tx_dict: dict, signature: bytes, public_key: VerifyingKey) -> bool:
+    def signing_payload(tx_dict: dict, binary: bool = False) -> bytes:
+        if binary:
+            return Transaction.from_dict(tx_dict).to_bytes()
+        return json.dumps(tx_dict, sort_keys=True).encode()
+
+    @staticmethod
+    def verify_transaction(tx_dict: dict, signature: bytes, public_key: VerifyingKey, binary: bool = False) -> bool:
         try:
-            data = json.dumps(tx_dict, sort_keys=True)
-            return public_key.verify(signature, data.encode())
+            return public_key.verify(signature, Transaction.signing_payload(tx_dict, binary))
         except Exception as e:
             print(f"[Ошибка] Проверка подписи: {e}")
             return False
 
+    @staticmethod
+    def verify_batch(
+        items: List[Tuple[dict, bytes, VerifyingKey]],
+        processes: Optional[int] = None,
+        chunk_size: int = 64,
+        binary: bool = False
+    ) -> List[bool]:
+        """Пакетная проверка подписей (tx_dict, signature, public_key).
+
+        Проверки распределяются по пулу процессов отрезками по chunk_size;
+        каждый процесс кеширует предвычисленные таблицы точек ключей
+        повторяющихся отправителей. Пул живёт между вызовами, чтобы кеши
+        рабочих процессов не терялись. Возвращает результат для каждой транзакции.
+        """
+        jobs = [(tx_dict, signature, public_key.to_string(), binary) for tx_dict, signature, public_key in items]
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(jobs) <= chunk_size:
+            return _verify_signature_chunk(jobs)
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        results = _verification_pool(processes).map(_verify_signature_chunk, chunks)
+        return [ok for chunk in results for ok in chunk]
+
+
+# ==============================
+# Рабочие функции пакетной проверки подписей
+# ==============================
+_VERIFYING_KEY_CACHE_SIZE = 1024
+# Таблица точек стоит около трёх обычных проверок и вдвое ускоряет каждую
+# следующую, поэтому строится с этой по счёту встречи ключа
+_PRECOMPUTE_AFTER_SIGHTINGS = 3
+# Значение — (ключ, сколько раз встречен; 0 — таблица уже построена)
+_verifying_key_cache: "OrderedDict[bytes, Tuple[VerifyingKey, int]]" = OrderedDict()
+_verify_pool: Optional[Pool] = None
+_verify_pool_processes = 0
+
+
+def _verification_pool(processes: int) -> Pool:
+    """Общий пул проверки подписей; пересоздаётся только при смене числа процессов"""
+    global _verify_pool, _verify_pool_processes
+    if _verify_pool is None or _verify_pool_processes != processes:
+        close_verification_pool()
+        _verify_pool = Pool(processes)
+        _verify_pool_processes = processes
+    return _verify_pool
+
+
+def close_verification_pool() -> None:
+    global _verify_pool
+    if _verify_pool is not None:
+        _verify_pool.terminate()
+        _verify_pool.join()
+        _verify_pool = None
+
+
+atexit.register(close_verification_pool)
+
+
+def _cached_verifying_key(key_bytes: bytes) -> VerifyingKey:
+    """LRU ключей по сырым байтам.
+
+    Таблица точек строится только для повторяющихся отправителей:
+    одноразовые ключи проверяются без неё.
+    """
+    cached = _verifying_key_cache.get(key_bytes)
+    if cached is None:
+        public_key = VerifyingKey.from_string(key_bytes, curve=SECP256k1)
+        _verifying_key_cache[key_bytes] = (public_key, 1)
+        if len(_verifying_key_cache) > _VERIFYING_KEY_CACHE_SIZE:
+            _verifying_key_cache.popitem(last=False)
+        return public_key
+    _verifying_key_cache.move_to_end(key_bytes)
+    public_key, sightings = cached
+    if sightings == 0:
+        return public_key
+    if sightings + 1 < _PRECOMPUTE_AFTER_SIGHTINGS:
+        _verifying_key_cache[key_bytes] = (public_key, sightings + 1)
+        return public_key
+    point = public_key.pubkey.point
+    # Таблицу умножения можно построить только для точки с известным порядком
+    point = PointJacobi(SECP256k1.curve, point.x(), point.y(), 1, SECP256k1.order, generator=True)
+    public_key = VerifyingKey.from_public_point(point, curve=SECP256k1)
+    public_key.precompute()
+    _verifying_key_cache[key_bytes] = (public_key, 0)
+    return public_key
+
+
+def _verify_signature_chunk(jobs: list) -> List[bool]:
+    results = []
+    for tx_dict, signature, key_bytes, binary in jobs:
+        # Как и verify_transaction: любая ошибка разбора или проверки — это
+        # отказ только для своей транзакции, а не для всего пакета
+        try:
+            data = Transaction.signing_payload(tx_dict, binary)
+            results.append(_cached_verifying_key(key_bytes).verify(signature, data))
+        except Exception:
+            results.append(False)
+    return results
+
+
+# ==============================
+# Дерево Меркла по транзакциям
+# ==============================
+EMPTY_MERKLE_ROOT = hashlib.sha256(b'').hexdigest()
+
+
+def merkle_leaf(tx_dict: dict) -> str:
+    data = json.dumps(tx_dict, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _merkle_parent(left: str, right: str) -> str:
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def build_merkle_levels(leaves: List[str]) -> List[List[str]]:
+    """Строит уровни дерева от листьев к корню.
+    Непарный последний узел уровня дублируется, как в Bitcoin."""
+    if not leaves:
+        return [[EMPTY_MERKLE_ROOT]]
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level = level + [level[-1]]
+        levels.append([_merkle_parent(level[i], level[i + 1]) for i in range(0, len(level), 2)])
+    return levels
+
+
+def merkle_leaf_bytes(tx_bytes: bytes) -> str:
+    return hashlib.sha256(tx_bytes).hexdigest()
+
+
+def verify_merkle_proof(
+    tx_dict: dict,
+    proof: List[Tuple[str, str]],
+    merkle_root: str,
+    binary: bool = False
+) -> bool:
+    """Проверка включения транзакции в блок по одному заголовку (для лёгкого клиента)"""
+    if binary:
+        current = merkle_leaf_bytes(Transaction.from_dict(tx_dict).to_bytes())
+    else:
+        current = merkle_leaf(tx_dict)
+    for sibling, side in proof:
+        if side == 'left':
+            current = _merkle_parent(sibling, current)
+        else:
+            current = _merkle_parent(current, sibling)
+    return current == merkle_root
+
 
 # ==============================
 # Класс Block — блок
@@ -50,99 +306,1311 @@ class Block:
         previous_hash: str,
         timestamp: float,
         transactions: List[Transaction],
-        nonce: int = 0
+        nonce: int = 0,
+        hash_format: str = "json",
+        proposer: str = ""
     ):
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = timestamp
         self.transactions = transactions
         self.nonce = nonce
+        # "json" — прежний формат хеширования, "binary" — компактный заголовок
+        self.hash_format = hash_format
+        # Блоки PoS: автор входит в хеш, подпись автора ставится поверх хеша
+        self.proposer = proposer
+        self.signature = ""
+        self.merkle_levels = self.compute_merkle_levels()
+        self.merkle_root = self.merkle_levels[-1][0]
         self.hash = self.compute_hash()
 
-    def compute_hash(self) -> str:
-        block_data = {
+    def compute_merkle_levels(self) -> List[List[str]]:
+        if self.hash_format == "binary":
+            return build_merkle_levels([merkle_leaf_bytes(tx.to_bytes()) for tx in self.transactions])
+        return build_merkle_levels([merkle_leaf(tx.to_dict()) for tx in self.transactions])
+
+    def header_data(self) -> Dict[str, Any]:
+        """Заголовок блока: транзакции представлены только корнем Меркла"""
+        header = {
             'index': self.index,
             'previous_hash': self.previous_hash,
             'timestamp': self.timestamp,
-            'transactions': [tx.to_dict() for tx in self.transactions],
+            'merkle_root': self.merkle_root,
             'nonce': self.nonce
         }
-        block_string = json.dumps(block_data, sort_keys=True)
+        # У блоков PoW автора нет, и их хеши остаются прежними
+        if self.proposer:
+            header['proposer'] = self.proposer
+        return header
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [tx.to_dict() for tx in self.transactions],
+            'nonce': self.nonce,
+            'hash': self.hash,
+            'hash_format': self.hash_format
+        }
+        if self.proposer:
+            data['proposer'] = self.proposer
+            data['signature'] = self.signature
+        return data
+
+    @staticmethod
+    def from_dict(data: dict) -> "Block":
+        block = Block(
+            index=data['index'],
+            previous_hash=data['previous_hash'],
+            timestamp=data['timestamp'],
+            transactions=[Transaction.from_dict(tx) for tx in data['transactions']],
+            nonce=data['nonce'],
+            hash_format=data.get('hash_format', "json"),
+            proposer=data.get('proposer', "")
+        )
+        # Хеш берётся сохранённый, чтобы проверка цепочки могла заметить порчу данных
+        block.hash = data['hash']
+        block.signature = data.get('signature', "")
+        return block
+
+    def header_prefix_bytes(self) -> bytes:
+        """Бинарный заголовок без nonce: nonce идёт последним полем"""
+        if len(self.previous_hash) == 64:
+            previous = _U8.pack(0) + bytes.fromhex(self.previous_hash)
+        else:
+            # Генезис ссылается на условный хеш "0"
+            previous = _U8.pack(1) + _pack_str(self.previous_hash)
+        return b''.join([
+            _U64.pack(self.index), previous, _F64.pack(self.timestamp), bytes.fromhex(self.merkle_root)
+        ])
+
+    def proposer_bytes(self) -> bytes:
+        """Хвост бинарного заголовка после nonce: автор блока PoS"""
+        return _pack_str(self.proposer) if self.proposer else b''
+
+    def to_bytes(self) -> bytes:
+        if self.hash_format != "binary":
+            raise ValueError("Бинарная сериализация доступна только для блоков формата binary")
+        parts = [
+            BINARY_BLOCK_MARKER, self.header_prefix_bytes(), _U64.pack(self.nonce),
+            bytes.fromhex(self.hash), _U32.pack(len(self.transactions))
+        ]
+        for tx in self.transactions:
+            tx_bytes = tx.to_bytes()
+            parts.append(_U32.pack(len(tx_bytes)))
+            parts.append(tx_bytes)
+        if self.proposer:
+            # Необязательный хвост: автор и подпись; у блоков PoW его нет
+            signature = bytes.fromhex(self.signature)
+            parts.extend([_pack_str(self.proposer), _U8.pack(len(signature)), signature])
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Block":
+        if data[:1] != BINARY_BLOCK_MARKER:
+            raise ValueError("Неизвестный формат блока")
+        offset = 1
+        (index,) = _U64.unpack_from(data, offset)
+        offset += _U64.size
+        (tag,) = _U8.unpack_from(data, offset)
+        offset += _U8.size
+        if tag == 0:
+            previous_hash = data[offset:offset + 32].hex()
+            offset += 32
+        else:
+            previous_hash, offset = _unpack_str(data, offset)
+        (timestamp,) = _F64.unpack_from(data, offset)
+        offset += _F64.size + 32  # корень Меркла пересчитывается по транзакциям
+        (nonce,) = _U64.unpack_from(data, offset)
+        offset += _U64.size
+        stored_hash = data[offset:offset + 32].hex()
+        offset += 32
+        (count,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        transactions = []
+        for _ in range(count):
+            (length,) = _U32.unpack_from(data, offset)
+            offset += _U32.size
+            transactions.append(Transaction.decode(data, offset)[0])
+            offset += length
+        proposer, signature = "", ""
+        if offset < len(data):
+            proposer, offset = _unpack_str(data, offset)
+            (length,) = _U8.unpack_from(data, offset)
+            offset += _U8.size
+            signature = data[offset:offset + length].hex()
+        block = Block(index, previous_hash, timestamp, transactions, nonce, hash_format="binary", proposer=proposer)
+        block.hash = stored_hash
+        block.signature = signature
+        return block
+
+    def compute_hash(self) -> str:
+        if self.hash_format == "binary":
+            return hashlib.sha256(
+                self.header_prefix_bytes() + _U64.pack(self.nonce) + self.proposer_bytes()
+            ).hexdigest()
+        block_string = json.dumps(self.header_data(), sort_keys=True)
         return hashlib.sha256(block_string.encode()).hexdigest()
 
+    def merkle_proof(self, tx_index: int) -> List[Tuple[str, str]]:
+        """Путь от листа транзакции до корня: пары (хеш соседа, его сторона)"""
+        if not 0 <= tx_index < len(self.transactions):
+            raise IndexError("Нет транзакции с таким индексом")
+        proof = []
+        position = tx_index
+        for level in self.merkle_levels[:-1]:
+            if position % 2:
+                proof.append((level[position - 1], 'left'))
+            else:
+                sibling = level[position + 1] if position + 1 < len(level) else level[position]
+                proof.append((sibling, 'right'))
+            position //= 2
+        return proof
+
+    def hash_template(self) -> tuple:
+        """Разбивает сериализованный блок на части до и после значения nonce.
+
+        Формат тот же, что в compute_hash(), так что
+        sha256(prefix + str(nonce) + suffix) даёт тот же самый хеш.
+        В бинарном формате за nonce идёт только автор блока PoS (если он есть).
+        """
+        if self.hash_format == "binary":
+            return self.header_prefix_bytes(), self.proposer_bytes()
+        header = self.header_data()
+        header['nonce'] = 0
+        block_string = json.dumps(header, sort_keys=True)
+        # Перед nonce в отсортированных ключах стоят только index и merkle_root,
+        # поэтому первое вхождение маркера — это ключ самого блока
+        marker = '"nonce": '
+        split_at = block_string.index(marker + '0') + len(marker)
+        return block_string[:split_at].encode(), block_string[split_at + 1:].encode()
+
     def mine(self, difficulty: int) -> None:
-        while not self.hash.startswith('0' * difficulty):
-            self.nonce += 1
-            self.hash = self.compute_hash()
+        target = '0' * difficulty
+        if self.hash.startswith(target):
+            return
+        prefix, suffix = self.hash_template()
+        midstate = hashlib.sha256(prefix)
+        binary = self.hash_format == "binary"
+        nonce = self.nonce
+        while True:
+            nonce += 1
+            block_hash = _hash_nonce(midstate, nonce, suffix, binary)
+            if block_hash.startswith(target):
+                break
+        self.nonce = nonce
+        self.hash = block_hash
+
+    def mine_parallel(self, difficulty: int, processes: Optional[int] = None, chunk_size: int = 20000) -> float:
+        """Параллельный перебор nonce в пуле процессов.
+
+        Пространство nonce делится на отрезки по chunk_size, результаты
+        забираются строго по порядку, поэтому найденный nonce совпадает
+        с результатом последовательного mine(). Возвращает хешей в секунду.
+        """
+        processes = processes or os.cpu_count() or 1
+        target = '0' * difficulty
+        prefix, suffix = self.hash_template()
+        found = Value('q', _NONCE_NOT_FOUND)
+        pending = deque()
+        next_start = self.nonce
+        hashes_done = 0
+        started = time.perf_counter()
+
+        with Pool(processes, initializer=_init_mining_worker, initargs=(found,)) as pool:
+            while True:
+                # Держим в работе ограниченное окно отрезков, чтобы не плодить задачи бесконечно
+                while len(pending) < processes * 2:
+                    args = (prefix, suffix, self.hash_format == "binary", target, next_start, next_start + chunk_size)
+                    pending.append(pool.apply_async(_search_nonce_range, (args,)))
+                    next_start += chunk_size
+                nonce, block_hash, hashes = pending.popleft().get()
+                hashes_done += hashes
+                if nonce is not None:
+                    break
+            pool.terminate()
+
+        elapsed = time.perf_counter() - started
+        self.nonce = nonce
+        self.hash = block_hash
+        return hashes_done / elapsed if elapsed > 0 else float(hashes_done)
+
+
+# ==============================
+# Рабочие функции параллельного майнинга
+# ==============================
+_NONCE_NOT_FOUND = 2 ** 63 - 1
+_mining_found = None
+
+
+def _hash_nonce(midstate, nonce: int, suffix: bytes, binary: bool = False) -> str:
+    """Дохеширует только nonce и хвост блока поверх сохранённого midstate"""
+    digest = midstate.copy()
+    digest.update((_U64.pack(nonce) if binary else str(nonce).encode()) + suffix)
+    return digest.hexdigest()
+
+
+def _init_mining_worker(found) -> None:
+    global _mining_found
+    _mining_found = found
+
+
+def _search_nonce_range(args) -> tuple:
+    """Перебирает nonce в [start, end). Прекращает работу, если другой
+    процесс уже нашёл решение с меньшим nonce."""
+    prefix, suffix, binary, target, start, end = args
+    midstate = hashlib.sha256(prefix)
+    for nonce in range(start, end):
+        if nonce % 1024 == 0 and _mining_found.value < start:
+            return None, None, nonce - start
+        block_hash = _hash_nonce(midstate, nonce, suffix, binary)
+        if block_hash.startswith(target):
+            with _mining_found.get_lock():
+                if nonce < _mining_found.value:
+                    _mining_found.value = nonce
+            return nonce, block_hash, nonce - start + 1
+    return None, None, end - start
+
+
+# ==============================
+# Класс Mempool — пул неподтверждённых транзакций
+# ==============================
+class Mempool:
+    """Пул ожидающих транзакций с индексом по хешу.
+
+    Транзакции одного отправителя выстраиваются по nonce (без nonce — по
+    порядку поступления), а между отправителями выбор идёт по комиссии,
+    затем по сумме. При превышении max_bytes вытесняются самые дешёвые.
+    """
+
+    def __init__(self, max_bytes: int = 1_000_000):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.by_id: Dict[str, Transaction] = {}
+        self._sizes: Dict[str, int] = {}
+        self._sender_queues: Dict[str, list] = {}  # отсортированные (nonce, seq, tx_id)
+        self._eviction_heap: list = []  # (fee, amount, -seq, tx_id), ленивое удаление
+        self._order_keys: Dict[str, tuple] = {}
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __contains__(self, tx_id: str) -> bool:
+        return tx_id in self.by_id
+
+    def __iter__(self):
+        return iter(list(self.by_id.values()))
+
+    def max_nonce(self, sender: str) -> int:
+        """Наибольший nonce отправителя в пуле (-1, если его транзакций нет)"""
+        queue = self._sender_queues.get(sender)
+        return queue[-1][0] if queue else -1
+
+    def add(self, transaction: Transaction) -> List[Transaction]:
+        """Добавляет транзакцию; возвращает вытесненные из-за лимита памяти"""
+        tx_id = transaction.tx_id()
+        if tx_id in self.by_id:
+            raise ValueError("Такая транзакция уже есть в пуле")
+        seq = next(self._seq)
+        order_key = (transaction.nonce if transaction.nonce is not None else 0, seq, tx_id)
+        size = len(json.dumps(transaction.to_dict(), sort_keys=True))
+
+        self.by_id[tx_id] = transaction
+        self._sizes[tx_id] = size
+        self._order_keys[tx_id] = order_key
+        bisect.insort(self._sender_queues.setdefault(transaction.sender, []), order_key)
+        heapq.heappush(self._eviction_heap, (transaction.fee, transaction.amount, -seq, tx_id))
+        self.size_bytes += size
+
+        evicted = []
+        while self.size_bytes > self.max_bytes and self._eviction_heap:
+            _, _, neg_seq, victim_id = heapq.heappop(self._eviction_heap)
+            if victim_id in self.by_id and self._order_keys[victim_id][1] == -neg_seq:
+                evicted.extend(self._evict(victim_id))
+        return evicted
+
+    def _evict(self, tx_id: str) -> List[Transaction]:
+        # Вслед за вытесненной уходят и более поздние транзакции отправителя,
+        # иначе они навсегда застрянут за пропуском в очереди
+        sender = self.by_id[tx_id].sender
+        queue = self._sender_queues[sender]
+        position = bisect.bisect_left(queue, self._order_keys[tx_id])
+        return [self.remove(key[2]) for key in list(queue[position:])]
+
+    def remove(self, tx_id: str) -> Transaction:
+        transaction = self.by_id.pop(tx_id)
+        self.size_bytes -= self._sizes.pop(tx_id)
+        order_key = self._order_keys.pop(tx_id)
+        queue = self._sender_queues[transaction.sender]
+        del queue[bisect.bisect_left(queue, order_key)]
+        if not queue:
+            del self._sender_queues[transaction.sender]
+        # Устаревшие записи кучи вытеснения чистятся, когда их становится слишком много
+        if len(self._eviction_heap) > 2 * len(self.by_id) + 64:
+            self._eviction_heap = [
+                (tx.fee, tx.amount, -self._order_keys[key][1], key) for key, tx in self.by_id.items()
+            ]
+            heapq.heapify(self._eviction_heap)
+        return transaction
+
+    def remove_many(self, transactions: List[Transaction]) -> None:
+        for transaction in transactions:
+            tx_id = transaction.tx_id()
+            if tx_id in self.by_id:
+                self.remove(tx_id)
+
+    def select(self, limit: int) -> List[Transaction]:
+        """Лучшие limit транзакций с соблюдением порядка внутри отправителя"""
+        heads = []
+        for sender, queue in self._sender_queues.items():
+            tx = self.by_id[queue[0][2]]
+            heads.append((-tx.fee, -tx.amount, queue[0][1], sender, 0))
+        heapq.heapify(heads)
+
+        selected = []
+        while heads and len(selected) < limit:
+            _, _, _, sender, position = heapq.heappop(heads)
+            queue = self._sender_queues[sender]
+            selected.append(self.by_id[queue[position][2]])
+            if position + 1 < len(queue):
+                tx = self.by_id[queue[position + 1][2]]
+                heapq.heappush(heads, (-tx.fee, -tx.amount, queue[position + 1][1], sender, position + 1))
+        return selected
+
+
+# ==============================
+# Класс LedgerState — балансы адресов
+# ==============================
+class LedgerState:
+    """Балансы адресов, обновляемые по мере добавления блоков.
+
+    Для каждого применённого блока хранится запись отката с прежними
+    балансами затронутых адресов, так что реорганизация откатывается
+    до точки форка, а не пересчитывается от генезиса. Комиссии сжигаются.
+    Перерасход запрещается, только если заданы начальные балансы.
+    """
+
+    def __init__(self, initial_balances: Optional[Dict[str, float]] = None):
+        self.enforce = initial_balances is not None
+        self.initial_balances = dict(initial_balances or {})
+        self.balances: Dict[str, float] = dict(self.initial_balances)
+        self.undo_log: List[Dict[str, Optional[float]]] = []  # undo_log[h - 1] — для блока высоты h
+
+    @property
+    def height(self) -> int:
+        return len(self.undo_log)
+
+    def balance(self, address: str) -> float:
+        return self.balances.get(address, 0.0)
+
+    def filter_affordable(self, transactions: List[Transaction]) -> Tuple[List[Transaction], List[Transaction]]:
+        """Делит транзакции на проходящие по балансу (по порядку) и перерасходы"""
+        if not self.enforce:
+            return list(transactions), []
+        balances: Dict[str, float] = {}
+        accepted, rejected = [], []
+        for tx in transactions:
+            for address in (tx.sender, tx.recipient):
+                balances.setdefault(address, self.balance(address))
+            spend = tx.amount + tx.fee
+            if balances[tx.sender] < spend:
+                rejected.append(tx)
+                continue
+            balances[tx.sender] -= spend
+            balances[tx.recipient] += tx.amount
+            accepted.append(tx)
+        return accepted, rejected
+
+    def apply_block(self, block: Block) -> None:
+        undo: Dict[str, Optional[float]] = {}
+        for tx in block.transactions:
+            for address in (tx.sender, tx.recipient):
+                if address not in undo:
+                    undo[address] = self.balances.get(address)
+            spend = tx.amount + tx.fee
+            if self.enforce and self.balance(tx.sender) < spend:
+                self._restore(undo)
+                raise ValueError(f"Перерасход средств у {tx.sender} в блоке {block.index}")
+            self.balances[tx.sender] = self.balance(tx.sender) - spend
+            self.balances[tx.recipient] = self.balance(tx.recipient) + tx.amount
+        self.undo_log.append(undo)
+
+    def revert_block(self) -> None:
+        self._restore(self.undo_log.pop())
+
+    def revert_to(self, height: int) -> None:
+        while self.height > height:
+            self.revert_block()
+
+    def _restore(self, undo: Dict[str, Optional[float]]) -> None:
+        for address, balance in undo.items():
+            if balance is None:
+                self.balances.pop(address, None)
+            else:
+                self.balances[address] = balance
+
+
+def encode_block_record(block: Block) -> bytes:
+    """Блок для диска и сети: бинарный формат или JSON, по формату хеширования"""
+    if block.hash_format == "binary":
+        return block.to_bytes()
+    return json.dumps(block.to_dict(), sort_keys=True).encode()
+
+
+def decode_block_record(data: bytes) -> Block:
+    if data[:1] == BINARY_BLOCK_MARKER:
+        return Block.from_bytes(data)
+    return Block.from_dict(json.loads(data))
+
+
+# ==============================
+# Класс BlockStore — хранилище блоков на диске
+# ==============================
+class BlockStore:
+    """Хранилище блоков только на дозапись, читаемое через mmap.
+
+    blocks.dat  — сериализованные блоки подряд (JSON или бинарный формат);
+    heights.idx — записи фиксированной длины (смещение, длина, хеш) по высоте;
+    hashes.idx  — хеш-таблица с открытой адресацией хеш -> высота.
+    Доступ к chain[i] и поиск по хешу стоят нескольких обращений к страницам,
+    а открытие хранилища не требует чтения всей цепочки.
+    """
+
+    RECORD = struct.Struct('>QI32s')
+    SLOT = struct.Struct('>32sQ')
+    TABLE_HEADER = struct.Struct('>QQ')  # ёмкость, число занятых слотов (с удалёнными)
+    DELETED = 2 ** 64 - 1
+
+    def __init__(self, directory: str, initial_capacity: int = 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._data_file = open(os.path.join(directory, "blocks.dat"), "a+b")
+        self._index_file = open(os.path.join(directory, "heights.idx"), "a+b")
+        self._data_map: Optional[mmap.mmap] = None
+        self._index_map: Optional[mmap.mmap] = None
+
+        # Обрезаем хвосты, которые могли остаться после аварийной остановки
+        self._count = os.path.getsize(self._index_file.name) // self.RECORD.size
+        self._index_file.truncate(self._count * self.RECORD.size)
+        data_end = 0
+        if self._count:
+            offset, length, _ = self._record(self._count - 1)
+            data_end = offset + length
+        self._data_file.truncate(data_end)
+
+        table_path = os.path.join(directory, "hashes.idx")
+        if not os.path.exists(table_path):
+            with open(table_path, "wb") as f:
+                f.write(self.TABLE_HEADER.pack(initial_capacity, 0))
+                f.truncate(self.TABLE_HEADER.size + initial_capacity * self.SLOT.size)
+        self._table_file = open(table_path, "r+b")
+        self._table_map = mmap.mmap(self._table_file.fileno(), 0)
+        self._capacity, self._used = self.TABLE_HEADER.unpack_from(self._table_map, 0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self._count))]
+        if item < 0:
+            item += self._count
+        if not 0 <= item < self._count:
+            raise IndexError("Нет блока с такой высотой")
+        offset, length, _ = self._record(item)
+        data_map = self._map("_data_map", self._data_file, offset + length)
+        return decode_block_record(data_map[offset:offset + length])
+
+    def __iter__(self):
+        for height in range(self._count):
+            yield self[height]
+
+    def hash_at(self, height: int) -> str:
+        return self._record(height)[2].hex()
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        key = bytes.fromhex(block_hash)
+        slot = self._find_slot(key)
+        stored_key, value = self.SLOT.unpack_from(self._table_map, self._slot_offset(slot))
+        if value in (0, self.DELETED):
+            return None
+        height = value - 1
+        # Запись таблицы могла пережить аварийно оборванную дозапись блока
+        if height >= self._count or self._record(height)[2] != key:
+            return None
+        return height
+
+    def append(self, block: Block) -> None:
+        data = encode_block_record(block)
+        offset = self._data_file.seek(0, os.SEEK_END)
+        self._data_file.write(data)
+        self._data_file.flush()
+        key = bytes.fromhex(block.hash)
+        self._index_file.write(self.RECORD.pack(offset, len(data), key))
+        self._index_file.flush()
+        self._count += 1
+        self._table_insert(key, self._count - 1)
+
+    def truncate(self, height: int) -> None:
+        """Оставляет блоки с высотами [0, height) — используется при реорганизации"""
+        if height >= self._count:
+            return
+        for removed in range(height, self._count):
+            key = self._record(removed)[2]
+            slot = self._find_slot(key)
+            self.SLOT.pack_into(self._table_map, self._slot_offset(slot), key, self.DELETED)
+        data_end = self._record(height)[0]
+        # Отображения нужно закрыть до усечения файлов
+        self._close_maps()
+        self._index_file.truncate(height * self.RECORD.size)
+        self._data_file.truncate(data_end)
+        self._count = height
+
+    def close(self) -> None:
+        self._close_maps()
+        self._table_map.flush()
+        self._table_map.close()
+        for f in (self._data_file, self._index_file, self._table_file):
+            f.close()
+
+    def _close_maps(self) -> None:
+        for name in ("_data_map", "_index_map"):
+            current = getattr(self, name)
+            if current is not None:
+                current.close()
+                setattr(self, name, None)
+
+    def _map(self, name: str, f, needed: int) -> mmap.mmap:
+        current = getattr(self, name)
+        if current is None or len(current) < needed:
+            # Файл дописан после отображения — перемапливаем
+            if current is not None:
+                current.close()
+            f.flush()
+            current = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            setattr(self, name, current)
+        return current
+
+    def _record(self, height: int) -> tuple:
+        position = height * self.RECORD.size
+        index_map = self._map("_index_map", self._index_file, position + self.RECORD.size)
+        return self.RECORD.unpack_from(index_map, position)
+
+    def _slot_offset(self, slot: int) -> int:
+        return self.TABLE_HEADER.size + slot * self.SLOT.size
+
+    def _find_slot(self, key: bytes, for_insert: bool = False) -> int:
+        """Слот с ключом либо первый пустой слот (при вставке — и удалённый)"""
+        slot = int.from_bytes(key[:8], 'big') % self._capacity
+        while True:
+            stored_key, value = self.SLOT.unpack_from(self._table_map, self._slot_offset(slot))
+            if value == 0 or stored_key == key or (for_insert and value == self.DELETED):
+                return slot
+            slot = (slot + 1) % self._capacity
+
+    def _table_insert(self, key: bytes, height: int) -> None:
+        slot = self._find_slot(key, for_insert=True)
+        _, value = self.SLOT.unpack_from(self._table_map, self._slot_offset(slot))
+        self.SLOT.pack_into(self._table_map, self._slot_offset(slot), key, height + 1)
+        if value == 0:
+            self._used += 1
+            self.TABLE_HEADER.pack_into(self._table_map, 0, self._capacity, self._used)
+        if self._used * 2 > self._capacity:
+            self._rebuild_table(self._capacity * 2)
+
+    def _rebuild_table(self, capacity: int) -> None:
+        # Заново раскладываем живые ключи по индексу высот; удалённые слоты исчезают
+        self._table_map.close()
+        self._table_file.truncate(0)
+        self._table_file.write(self.TABLE_HEADER.pack(capacity, 0))
+        self._table_file.truncate(self.TABLE_HEADER.size + capacity * self.SLOT.size)
+        self._table_file.flush()
+        self._table_map = mmap.mmap(self._table_file.fileno(), 0)
+        self._capacity, self._used = capacity, 0
+        for height in range(self._count):
+            key = self._record(height)[2]
+            self.SLOT.pack_into(self._table_map, self._slot_offset(self._find_slot(key, True)), key, height + 1)
+            self._used += 1
+        self.TABLE_HEADER.pack_into(self._table_map, 0, self._capacity, self._used)
+
+
+# ==============================
+# Консенсус: запечатывание и проверка блоков
+# ==============================
+def verify_block_link(block: Block, prev_block: Block) -> bool:
+    """Общая часть проверки: связь с предыдущим блоком, корень Меркла и пересчитанный хеш"""
+    if block.previous_hash != prev_block.hash or block.index != prev_block.index + 1:
+        return False
+    levels = block.compute_merkle_levels()
+    # Повтор транзакции не меняет корень при дублировании непарного узла
+    # ([t0,t1,t2] и [t0,t1,t2,t2]), поэтому одинаковые листья запрещены
+    if len(set(levels[0])) != len(levels[0]) or levels[-1][0] != block.merkle_root:
+        return False
+    return block.compute_hash() == block.hash
+
+
+class ConsensusEngine(ABC):
+    """Интерфейс консенсуса для Blockchain: seal() дописывает доказательство
+    в новый блок, verify() проверяет блок поверх предыдущего"""
+
+    def attach(self, genesis: Block) -> None:
+        """Вызывается цепочкой, которая начинает пользоваться движком"""
+
+    @abstractmethod
+    def seal(self, block: Block, prev_block: Block) -> None:
+        ...
+
+    @abstractmethod
+    def verify(self, block: Block, prev_block: Block) -> bool:
+        ...
+
+
+class ProofOfWork(ConsensusEngine):
+    """Прежний консенсус: перебор nonce до хеша с difficulty нулями"""
+
+    def __init__(self, difficulty: int = 2, processes: int = 1):
+        self.difficulty = difficulty
+        self.processes = processes
+        self.last_hash_rate = 0.0
+
+    def seal(self, block: Block, prev_block: Block) -> None:
+        if self.processes > 1:
+            self.last_hash_rate = block.mine_parallel(self.difficulty, self.processes)
+        else:
+            block.mine(self.difficulty)
+
+    def verify(self, block: Block, prev_block: Block) -> bool:
+        return verify_block_link(block, prev_block) and block.hash.startswith('0' * self.difficulty)
+
+
+class ProofOfStake(ConsensusEngine):
+    """Автор блока выбирается по стейку, блок подписывается его ключом ECDSA.
+
+    Выбор детерминирован зерном цепочки (по умолчанию хешем генезиса) и
+    высотой блока: автор не может подобрать их так, чтобы выпасть снова,
+    а любой узел с той же таблицей стейков пересчитает автора и не примет
+    блок от кого-то другого. Перебора nonce нет: он всегда равен нулю,
+    а запечатывание стоит одной подписи.
+    """
+
+    def __init__(
+        self,
+        stakes: Dict[str, float],
+        public_keys: Dict[str, VerifyingKey],
+        signing_keys: Optional[Dict[str, SigningKey]] = None,
+        seed: Optional[str] = None
+    ):
+        if any(stake <= 0 for stake in stakes.values()):
+            raise ValueError("Стейк валидатора должен быть больше нуля")
+        missing = set(stakes) - set(public_keys)
+        if missing:
+            raise ValueError(f"Нет открытых ключей валидаторов: {', '.join(sorted(missing))}")
+        # Порядок имён фиксирован, чтобы выбор автора не зависел от порядка словаря
+        self.names = sorted(stakes)
+        self.cumulative = list(itertools.accumulate(stakes[name] for name in self.names))
+        self.key_bytes = {name: public_keys[name].to_string() for name in self.names}
+        self.signing_keys = signing_keys or {}
+        self.seed = seed
+
+    @staticmethod
+    def generate(stakes: Dict[str, float], seed: Optional[str] = None) -> "ProofOfStake":
+        """Движок, у которого есть ключи всех валидаторов (демо и бенчмарки)"""
+        signing_keys = {name: SigningKey.generate(curve=SECP256k1) for name in stakes}
+        public_keys = {name: key.get_verifying_key() for name, key in signing_keys.items()}
+        return ProofOfStake(stakes, public_keys, signing_keys, seed)
+
+    def attach(self, genesis: Block) -> None:
+        # Зерно фиксируется один раз: генезис не зависит от будущих авторов блоков
+        if self.seed is None:
+            self.seed = genesis.hash
+
+    def proposer_for(self, index: int) -> str:
+        if self.seed is None:
+            raise RuntimeError("Зерно выбора авторов не задано: движок не привязан к цепочке")
+        draw = random.Random(f"{self.seed}:{index}").uniform(0, self.cumulative[-1])
+        position = bisect.bisect_right(self.cumulative, draw)
+        return self.names[min(position, len(self.names) - 1)]
+
+    def seal(self, block: Block, prev_block: Block) -> None:
+        proposer = self.proposer_for(block.index)
+        private_key = self.signing_keys.get(proposer)
+        if private_key is None:
+            raise ValueError(f"Очередь блока у {proposer}, а его ключа на этом узле нет")
+        block.proposer = proposer
+        block.hash = block.compute_hash()
+        block.signature = private_key.sign(bytes.fromhex(block.hash)).hex()
+
+    def verify(self, block: Block, prev_block: Block) -> bool:
+        if block.nonce != 0 or block.proposer != self.proposer_for(block.index):
+            return False
+        if not verify_block_link(block, prev_block):
+            return False
+        try:
+            return _cached_verifying_key(self.key_bytes[block.proposer]).verify(
+                bytes.fromhex(block.signature), bytes.fromhex(block.hash)
+            )
+        except (BadSignatureError, ValueError):
+            return False
 
 
 # ==============================
 # Класс Blockchain — блокчейн
 # ==============================
 class Blockchain:
-    def __init__(self, difficulty: int = 2):
-        self.chain: List[Block] = [self.create_genesis_block()]
+    def __init__(
+        self,
+        difficulty: int = 2,
+        mining_processes: int = 1,
+        max_block_transactions: int = 500,
+        mempool_bytes: int = 1_000_000,
+        initial_balances: Optional[Dict[str, float]] = None,
+        store: Optional[BlockStore] = None,
+        hash_format: str = "json",
+        consensus: Optional[ConsensusEngine] = None
+    ):
+        self.hash_format = hash_format
+        self.store = store
+        self.height_by_hash: Dict[str, int] = {}
+        if store is None:
+            self.chain: List[Block] = []
+            self._append_block(self.create_genesis_block())
+        else:
+            if len(store) == 0:
+                store.append(self.create_genesis_block())
+            self.chain = store
         self.difficulty = difficulty
-        self.current_transactions: List[Transaction] = []
+        self.mining_processes = mining_processes
+        # По умолчанию — прежний PoW с заданной сложностью
+        self.consensus = consensus if consensus is not None else ProofOfWork(difficulty, mining_processes)
+        self.consensus.attach(self.chain[0])
+        self.max_block_transactions = max_block_transactions
+        self.mempool = Mempool(max_bytes=mempool_bytes)
+        self.initial_balances = initial_balances
+        self._ledger: Optional[LedgerState] = None
+        self.pending_spend: Dict[str, float] = {}  # сколько отправитель уже потратил в пуле
+        self.issued_nonces: Dict[str, int] = {}  # последний выданный next_nonce() nonce
+        # Принимается как есть только генезис: блоки, прочитанные с диска, могли
+        # быть испорчены, поэтому is_valid_chain() проверит их при первом вызове.
+        # Блоки до verified_height включительно уже перепроверены
+        self.verified_height = 0
+
+    @property
+    def ledger(self) -> LedgerState:
+        # Балансы восстанавливаются проигрыванием блоков только при первом обращении,
+        # чтобы холодный старт с диска не читал всю цепочку
+        if self._ledger is None:
+            self._ledger = LedgerState(self.initial_balances)
+            for block in itertools.islice(self.chain, 1, None):
+                self._ledger.apply_block(block)
+        return self._ledger
+
+    @ledger.setter
+    def ledger(self, ledger: LedgerState) -> None:
+        self._ledger = ledger
+
+    def _tracked_ledger(self) -> Optional[LedgerState]:
+        """Балансы, которые нужно вести при изменениях цепочки. Без начальных
+        балансов перерасход не проверяется, и пока их никто не запросил,
+        проигрывать ради них цепочку с диска незачем (None)."""
+        if self.initial_balances is not None:
+            return self.ledger
+        return self._ledger
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        if self.store is not None:
+            return self.store.height_of(block_hash)
+        return self.height_by_hash.get(block_hash)
+
+    def hash_at(self, height: int) -> str:
+        if self.store is not None:
+            return self.store.hash_at(height)
+        return self.chain[height].hash
+
+    def _append_block(self, block: Block) -> None:
+        self.chain.append(block)
+        if self.store is None:
+            self.height_by_hash[block.hash] = len(self.chain) - 1
+
+    def _truncate_chain(self, height: int) -> None:
+        if self.store is not None:
+            self.store.truncate(height)
+            return
+        for block in self.chain[height:]:
+            self.height_by_hash.pop(block.hash, None)
+        self.chain = self.chain[:height]
+
+    @property
+    def last_hash_rate(self) -> float:
+        return getattr(self.consensus, 'last_hash_rate', 0.0)
+
+    @property
+    def current_transactions(self) -> List[Transaction]:
+        return list(self.mempool)
 
     def create_genesis_block(self) -> Block:
-        return Block(index=0, previous_hash="0", timestamp=time.time(), transactions=[])
+        return Block(index=0, previous_hash="0", timestamp=time.time(), transactions=[], hash_format=self.hash_format)
+
+    def next_nonce(self, sender: str) -> int:
+        """nonce для новой транзакции отправителя: без него одинаковые
+        переводы имеют один tx_id и повтор отклоняется пулом"""
+        nonce = max(self.issued_nonces.get(sender, -1), self.mempool.max_nonce(sender)) + 1
+        self.issued_nonces[sender] = nonce
+        return nonce
 
     def new_transaction(self, transaction: Transaction) -> None:
         if transaction.amount <= 0:
             raise ValueError("Сумма транзакции должна быть больше нуля")
-        self.current_transactions.append(transaction)
+        if transaction.fee < 0:
+            raise ValueError("Комиссия не может быть отрицательной")
+        spend = transaction.amount + transaction.fee
+        pending = self.pending_spend.get(transaction.sender, 0.0)
+        ledger = self._tracked_ledger()
+        if ledger is not None and ledger.enforce and ledger.balance(transaction.sender) - pending < spend:
+            raise ValueError(f"Недостаточно средств у {transaction.sender}")
+        evicted = self.mempool.add(transaction)
+        self.pending_spend[transaction.sender] = pending + spend
+        self._release_pending(evicted)
+
+    def _release_pending(self, transactions: List[Transaction]) -> None:
+        for tx in transactions:
+            remaining = self.pending_spend.get(tx.sender, 0.0) - tx.amount - tx.fee
+            if remaining > 1e-9:
+                self.pending_spend[tx.sender] = remaining
+            else:
+                self.pending_spend.pop(tx.sender, None)
 
     def create_block(self) -> Block:
         last_block = self.chain[-1]
+        selected = self.mempool.select(self.max_block_transactions)
+        # После реорганизации часть транзакций пула могла стать перерасходом
+        ledger = self._tracked_ledger()
+        transactions, rejected = ledger.filter_affordable(selected) if ledger is not None else (selected, [])
+        self.mempool.remove_many(rejected)
+        self._release_pending(rejected)
         new_block = Block(
             index=last_block.index + 1,
             previous_hash=last_block.hash,
             timestamp=time.time(),
-            transactions=self.current_transactions
+            transactions=transactions,
+            hash_format=self.hash_format
         )
-        new_block.mine(self.difficulty)
-        self.chain.append(new_block)
-        self.current_transactions = []
+        self.consensus.seal(new_block, last_block)
+        if ledger is not None:
+            ledger.apply_block(new_block)
+        self._append_block(new_block)
+        self.mempool.remove_many(transactions)
+        self._release_pending(transactions)
         return new_block
 
     def is_valid_chain(self) -> bool:
-        prev_block = self.chain[0]
-        for block in self.chain[1:]:
-            if block.previous_hash != prev_block.hash:
+        """Перепроверяет только блоки выше последнего проверенного"""
+        for height in range(self.verified_height + 1, len(self.chain)):
+            try:
+                block, prev_block = self.chain[height], self.chain[height - 1]
+            except (ValueError, KeyError, IndexError, struct.error):
+                return False  # запись на диске испорчена так, что не читается
+            if not self.consensus.verify(block, prev_block):
                 return False
-            if not block.hash.startswith('0' * self.difficulty):
+            self.verified_height = height
+        return True
+
+    def find_fork_point(self, new_chain: List[Block]) -> int:
+        """Высота последнего общего блока с цепочкой-кандидатом (-1, если генезис разный).
+        Общий префикс ищется бинарным поиском по индексу высота/хеш."""
+        low, high = 0, min(len(self.chain), len(new_chain)) - 1
+        if self.height_of(new_chain[0].hash) != 0:
+            return -1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.height_of(new_chain[middle].hash) == middle:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def replace_chain(self, new_chain: List[Block]) -> bool:
+        if len(new_chain) <= len(self.chain):
+            return False
+        fork_height = self.find_fork_point(new_chain)
+        if fork_height < 0:
+            # Чужой генезис: как и раньше, проверяем кандидата целиком
+            if not Blockchain.check_chain_validity(new_chain, self.difficulty, self.consensus):
                 return False
-            prev_block = block
+            start = 0
+        else:
+            # Общий префикс уже наш; перепроверяем только непроверенную часть
+            start = min(fork_height, self.verified_height) + 1
+            prev_block = self.chain[start - 1]
+            for block in new_chain[start:]:
+                if not self.consensus.verify(block, prev_block):
+                    return False
+                prev_block = block
+
+        suffix = list(new_chain[start:])
+        orphaned = [self.chain[height] for height in range(start, len(self.chain))]
+        if not self._reorganize_ledger(suffix, start):
+            return False
+        self._truncate_chain(start)
+        for block in suffix:
+            self._append_block(block)
+        self.verified_height = len(self.chain) - 1
+        self._sync_mempool(orphaned, suffix)
         return True
 
-    def replace_chain(self, new_chain: List[Block]) -> None:
-        if len(new_chain) > len(self.chain) and Blockchain.check_chain_validity(new_chain, self.difficulty):
-            self.chain = new_chain
+    def _sync_mempool(self, orphaned: List[Block], adopted: List[Block]) -> None:
+        """После реорганизации: транзакции принятых блоков уходят из пула,
+        а транзакции брошенной ветки, которых нет в новой, возвращаются в него"""
+        adopted_ids = set()
+        for block in adopted:
+            for tx in block.transactions:
+                tx_id = tx.tx_id()
+                adopted_ids.add(tx_id)
+                if tx_id in self.mempool:
+                    self._release_pending([self.mempool.remove(tx_id)])
+        for block in orphaned:
+            for tx in block.transactions:
+                tx_id = tx.tx_id()
+                if tx_id in adopted_ids or tx_id in self.mempool:
+                    continue
+                try:
+                    self.new_transaction(tx)
+                except ValueError:
+                    pass  # в новой ветке отправителю уже не хватает средств
+
+    def _reorganize_ledger(self, suffix: List[Block], start: int) -> bool:
+        """Откатывает балансы до точки форка и применяет новые блоки.
+        start=0 означает чужой генезис — состояние строится заново."""
+        if self._tracked_ledger() is None:
+            return True  # балансы ещё не построены и будут проиграны по новой цепочке
+        if start == 0:
+            ledger = LedgerState(self.initial_balances)
+            try:
+                for block in suffix[1:]:
+                    ledger.apply_block(block)
+            except ValueError:
+                return False
+            self.ledger = ledger
+            return True
+
+        self.ledger.revert_to(start - 1)
+        try:
+            for block in suffix:
+                self.ledger.apply_block(block)
+        except ValueError:
+            # Кандидат перерасходует средства — возвращаем свою ветку
+            self.ledger.revert_to(start - 1)
+            for block in self.chain[start:]:
+                self.ledger.apply_block(block)
+            return False
+        return True
 
     @staticmethod
-    def check_chain_validity(chain: List[Block], difficulty: int) -> bool:
+    def check_chain_validity(
+        chain: List[Block], difficulty: int, consensus: Optional[ConsensusEngine] = None
+    ) -> bool:
+        consensus = consensus if consensus is not None else ProofOfWork(difficulty)
+        # Движок, ещё не привязанный к цепочке, берёт зерно из генезиса кандидата
+        consensus.attach(chain[0])
         prev_block = chain[0]
         for block in chain[1:]:
-            if block.previous_hash != prev_block.hash:
-                return False
-            if not block.hash.startswith('0' * difficulty):
+            if not consensus.verify(block, prev_block):
                 return False
             prev_block = block
         return True
 
 
+# ==============================
+# Сетевая синхронизация узлов (asyncio, TCP)
+# ==============================
+# Кадр: u32 длина тела; тело: u32 длина JSON-заголовка, заголовок,
+# затем записи блоков (u32 длина + данные) в формате encode_block_record.
+MAX_BLOCKS_PER_REQUEST = 500
+
+
+async def _write_frame(writer: asyncio.StreamWriter, header: dict, records: Sequence[bytes] = ()) -> None:
+    header_bytes = json.dumps(header).encode()
+    parts = [_U32.pack(len(header_bytes)), header_bytes]
+    for record in records:
+        parts.append(_U32.pack(len(record)))
+        parts.append(record)
+    body = b''.join(parts)
+    writer.write(_U32.pack(len(body)) + body)
+    await writer.drain()
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[dict, List[bytes]]:
+    (length,) = _U32.unpack(await reader.readexactly(_U32.size))
+    body = await reader.readexactly(length)
+    (header_length,) = _U32.unpack_from(body, 0)
+    offset = _U32.size + header_length
+    header = json.loads(body[_U32.size:offset])
+    records = []
+    while offset < len(body):
+        (record_length,) = _U32.unpack_from(body, offset)
+        offset += _U32.size
+        records.append(body[offset:offset + record_length])
+        offset += record_length
+    return header, records
+
+
+class ChainView:
+    """Цепочка-кандидат без копирования: наши блоки [0, start) и хвост от пира"""
+
+    def __init__(self, prefix: Sequence[Block], start: int, suffix: List[Block]):
+        self.prefix = prefix
+        self.start = start
+        self.suffix = suffix
+
+    def __len__(self) -> int:
+        return self.start + len(self.suffix)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Нет блока с такой высотой")
+        return self.prefix[item] if item < self.start else self.suffix[item - self.start]
+
+
+class PeerServer:
+    """Отдаёт пирам статус цепочки, хеши по высотам и диапазоны блоков"""
+
+    def __init__(self, blockchain: "Blockchain", host: str = "127.0.0.1", port: int = 0):
+        self.blockchain = blockchain
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._handlers: set = set()
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            # Открытые соединения не закрываются вместе с сервером — завершаем их сами
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Запросы одного соединения обрабатываются по порядку, поэтому клиент
+        # может отправить несколько подряд и читать ответы конвейером
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request, _ = await _read_frame(reader)
+                response, records = self._dispatch(request)
+                await _write_frame(writer, response, records)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    def _dispatch(self, request: dict) -> Tuple[dict, List[bytes]]:
+        blockchain = self.blockchain
+        height = len(blockchain.chain) - 1
+        kind = request.get("type")
+        if kind == "status":
+            return {"height": height, "tip": blockchain.hash_at(height)}, []
+        if kind == "hashes":
+            hashes = [blockchain.hash_at(h) if 0 <= h <= height else None for h in request["heights"]]
+            return {"hashes": hashes}, []
+        if kind == "blocks":
+            start = max(0, request["start"])
+            end = min(height + 1, start + min(request["count"], MAX_BLOCKS_PER_REQUEST))
+            records = [encode_block_record(blockchain.chain[h]) for h in range(start, end)]
+            return {"start": start}, records
+        return {"error": f"неизвестный запрос {kind}"}, []
+
+
+class PeerClient:
+    """Клиент одного пира с пулом соединений и конвейерной отправкой запросов"""
+
+    def __init__(self, host: str, port: int, pool_size: int = 4):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def request(self, message: dict) -> Tuple[dict, List[bytes]]:
+        return (await self.request_pipelined([message]))[0]
+
+    async def request_pipelined(self, messages: List[dict]) -> List[Tuple[dict, List[bytes]]]:
+        """Отправляет все запросы по одному соединению и затем читает ответы по порядку"""
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                for message in messages:
+                    await _write_frame(writer, message)
+                responses = [await _read_frame(reader) for _ in messages]
+            except BaseException:
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            return responses
+
+    async def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+async def _find_common_height(blockchain: "Blockchain", client: PeerClient, peer_height: int) -> int:
+    """Высота последнего общего блока с пиром (-1 — разный генезис).
+    Сначала сверяются хеши на экспоненциально разреженных высотах от вершины,
+    затем — все высоты в найденном промежутке, так что объём обмена зависит
+    от глубины расхождения, а не от длины цепочки."""
+    top = min(len(blockchain.chain) - 1, peer_height)
+    heights, step, height = [], 1, top
+    while height > 0:
+        heights.append(height)
+        height -= step
+        step *= 2
+    heights.append(0)
+    response, _ = await client.request({"type": "hashes", "heights": heights})
+    upper = top + 1
+    for height, block_hash in zip(heights, response["hashes"]):
+        if block_hash is not None and blockchain.height_of(block_hash) == height:
+            break
+        upper = height
+    else:
+        return -1
+    gap = list(range(upper - 1, height, -1))
+    if gap:
+        response, _ = await client.request({"type": "hashes", "heights": gap})
+        for gap_height, block_hash in zip(gap, response["hashes"]):
+            if block_hash is not None and blockchain.height_of(block_hash) == gap_height:
+                return gap_height
+    return height
+
+
+async def sync_with_peer(blockchain: "Blockchain", client: PeerClient, batch_size: int = 200) -> bool:
+    """Заголовки сначала: находим точку форка, затем качаем только недостающие
+    диапазоны блоков параллельно по соединениям пула и передаём в replace_chain"""
+    status, _ = await client.request({"type": "status"})
+    peer_height = status["height"]
+    if peer_height + 1 <= len(blockchain.chain):
+        return False
+    start = await _find_common_height(blockchain, client, peer_height) + 1
+
+    batch_size = min(batch_size, MAX_BLOCKS_PER_REQUEST)
+    ranges = [(h, min(batch_size, peer_height + 1 - h)) for h in range(start, peer_height + 1, batch_size)]
+    groups = [ranges[i::client.pool_size] for i in range(client.pool_size)]
+    results = await asyncio.gather(*(
+        client.request_pipelined([{"type": "blocks", "start": h, "count": n} for h, n in group])
+        for group in groups if group
+    ))
+    received: Dict[int, List[Block]] = {}
+    for responses in results:
+        for header, records in responses:
+            received[header["start"]] = [decode_block_record(record) for record in records]
+    suffix = [block for h, _ in ranges for block in received[h]]
+    if len(suffix) != peer_height + 1 - start:
+        return False
+    return blockchain.replace_chain(ChainView(blockchain.chain, start, suffix))
+
+
+class NetworkNode:
+    """Узел сети на localhost: сервер для пиров и клиенты к ним"""
+
+    def __init__(self, blockchain: "Blockchain", port: int = 0, peer_ports: Sequence[int] = (), host: str = "127.0.0.1"):
+        self.blockchain = blockchain
+        self.server = PeerServer(blockchain, host, port)
+        self.peers = [PeerClient(host, peer_port) for peer_port in peer_ports]
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def sync_once(self) -> bool:
+        """Опрашивает всех пиров; True, если цепочка была заменена"""
+        replaced = False
+        for peer in self.peers:
+            try:
+                replaced = await sync_with_peer(self.blockchain, peer) or replaced
+            except (OSError, asyncio.IncompleteReadError):
+                continue  # пир ещё не поднялся или отключился
+        return replaced
+
+    async def peer_tips(self) -> List[Tuple[int, str]]:
+        tips = []
+        for peer in self.peers:
+            try:
+                status, _ = await peer.request({"type": "status"})
+                tips.append((status["height"], status["tip"]))
+            except (OSError, asyncio.IncompleteReadError):
+                continue
+        return tips
+
+    async def close(self) -> None:
+        for peer in self.peers:
+            await peer.close()
+        await self.server.close()
+
+
+async def _run_headless_node(name: str, port: int, peer_ports: List[int], blocks: int, difficulty: int, linger: float):
+    node = NetworkNode(Blockchain(difficulty=difficulty), port, peer_ports)
+    await node.start()
+    blockchain = node.blockchain
+    for i in range(blocks):
+        await asyncio.sleep(random.uniform(0.05, 0.3))
+        await node.sync_once()
+        blockchain.new_transaction(Transaction(name, f"peer{i}", 1.0, nonce=i))
+        blockchain.create_block()
+        print(f"[{name}] Добыт блок {len(blockchain.chain) - 1}")
+
+    # Досинхронизация: при равной длине, но разных вершинах добываем ещё блок,
+    # чтобы одна из веток стала длиннее и сеть сошлась
+    deadline = time.monotonic() + linger
+    while time.monotonic() < deadline:
+        await node.sync_once()
+        tip = (len(blockchain.chain) - 1, blockchain.hash_at(len(blockchain.chain) - 1))
+        tips = await node.peer_tips()
+        if tips and any(t[0] == tip[0] and t[1] != tip[1] for t in tips) and random.random() < 0.3:
+            blockchain.new_transaction(Transaction(name, "tie-break", 1.0, nonce=int(time.time() * 1000)))
+            blockchain.create_block()
+        await asyncio.sleep(0.2)
+    height = len(blockchain.chain) - 1
+    print(f"[{name}] Итог: высота {height}, вершина {blockchain.hash_at(height)[:16]}..., "
+          f"цепочка корректна: {blockchain.is_valid_chain()}")
+    await node.close()
+
+
+def run_headless_node(name: str, port: int, peer_ports: List[int], blocks: int = 5, difficulty: int = 3, linger: float = 5.0):
+    asyncio.run(_run_headless_node(name, port, peer_ports, blocks, difficulty, linger))
+
+
 # ==============================
 # Графический интерфейс — GUI
 # ==============================
 class BlockchainApp:
-    def __init__(self, root: tk.Tk, node_name: str, peer_node: Optional["BlockchainApp"] = None):
+    def __init__(
+        self,
+        root: tk.Tk,
+        node_name: str,
+        peer_node: Optional["BlockchainApp"] = None,
+        port: Optional[int] = None,
+        peer_ports: Sequence[int] = ()
+    ):
         self.root = root
         self.node_name = node_name
         self.blockchain = Blockchain()
         self.private_key = SigningKey.generate(curve=SECP256k1)
         self.public_key = self.private_key.get_verifying_key()
         self.peer_node = peer_node
+        self.network: Optional[NetworkNode] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        if port is not None:
+            self.start_network(port, peer_ports)
 
         self.root.title(f"Блокчейн - {node_name}")
 
@@ -190,7 +1658,7 @@ class BlockchainApp:
             if amount <= 0:
                 raise ValueError("Сумма должна быть положительной")
 
-            tx = Transaction(sender, recipient, amount)
+            tx = Transaction(sender, recipient, amount, nonce=self.blockchain.next_nonce(sender))
             signature = tx.sign_transaction(self.private_key)
 
             if Transaction.verify_transaction(tx.to_dict(), signature, self.public_key):
@@ -216,33 +1684,70 @@ class BlockchainApp:
         for block in self.blockchain.chain:
             self.chain_text.insert(tk.END, f"{block.index} | {block.hash[:20]}... | Транзакции: {len(block.transactions)}\n")
 
+    def start_network(self, port: int, peer_ports: Sequence[int]) -> None:
+        """Поднимает сетевой узел в отдельном потоке со своим циклом asyncio"""
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        async def create_node() -> NetworkNode:
+            node = NetworkNode(self.blockchain, port, peer_ports)
+            await node.start()
+            return node
+
+        self.network = asyncio.run_coroutine_threadsafe(create_node(), self.loop).result()
+
     def sync_with_other_node(self) -> None:
         if self.peer_node:
             other_blockchain = self.peer_node.blockchain
             self.blockchain.replace_chain(other_blockchain.chain)
             self.update_chain_display()
             messagebox.showinfo("Синхронизация", "Цепочка обновлена.")
+        elif self.network and self.network.peers:
+            replaced = asyncio.run_coroutine_threadsafe(self.network.sync_once(), self.loop).result(timeout=30)
+            self.update_chain_display()
+            messagebox.showinfo("Синхронизация", "Цепочка обновлена." if replaced else "Цепочка уже актуальна.")
         else:
             messagebox.showwarning("Ошибка", "Нет доступных узлов для синхронизации.")
 
 
 # ==============================
-# Запуск двух GUI-узлов (через multiprocessing)
+# Запуск узлов (через multiprocessing)
 # ==============================
-def run_gui_node(name: str, peer_app: Optional[BlockchainApp] = None):
+def run_gui_node(
+    name: str,
+    peer_app: Optional[BlockchainApp] = None,
+    port: Optional[int] = None,
+    peer_ports: Sequence[int] = ()
+):
     root = tk.Tk()
-    app = BlockchainApp(root, name, peer_app)
+    app = BlockchainApp(root, name, peer_app, port, peer_ports)
     root.mainloop()
 
 if __name__ == "__main__":
+    import argparse
     from multiprocessing import freeze_support
     freeze_support()
 
-    p1 = Process(target=run_gui_node, args=("Node A",))
-    p2 = Process(target=run_gui_node, args=("Node B",))
+    parser = argparse.ArgumentParser(description="Узлы блокчейна PoW")
+    parser.add_argument("--headless", action="store_true", help="запустить узлы без GUI")
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--blocks", type=int, default=5, help="сколько блоков добывает каждый узел")
+    parser.add_argument("--difficulty", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=5001)
+    args = parser.parse_args()
 
-    p1.start()
-    p2.start()
+    ports = [args.base_port + i for i in range(args.nodes)]
+    processes = []
+    for i, port in enumerate(ports):
+        name = f"Node {chr(ord('A') + i)}" if i < 26 else f"Node {i}"
+        peer_ports = [p for p in ports if p != port]
+        if args.headless:
+            target, node_args = run_headless_node, (name, port, peer_ports, args.blocks, args.difficulty)
+        else:
+            target, node_args = run_gui_node, (name, None, port, peer_ports)
+        processes.append(Process(target=target, args=node_args))
 
-    p1.join()
-    p2.join()
\ No newline at end of file
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
\ No newline at end of file
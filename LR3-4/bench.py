@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from main import (READ_CONSISTENCY, WAL_SYNC_POLICIES, AsyncSMRCluster, CommandBatcher, ShardedSMR, SMRNetwork,
+                  decode_command, encode_command)
+
+
+# ==============================
+# Бенчмарки
+# ==============================
+def _timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def bench_serialize(args) -> None:
+    commands = [{"key": f"key{i % args.keys}", "value": i if i % 2 else f"value{i}"} for i in range(args.commands)]
+    print(f"[Бенчмарк] {args.commands} команд журнала, {args.keys} ключей")
+
+    json_encoded = [json.dumps(cmd).encode() for cmd in commands]
+    binary_encoded = [encode_command(cmd) for cmd in commands]
+    json_time = _timed(lambda: [json.dumps(cmd).encode() for cmd in commands])
+    binary_time = _timed(lambda: [encode_command(cmd) for cmd in commands])
+    print(f"  кодирование    : JSON {json_time * 1000:8.1f} мс | binary {binary_time * 1000:8.1f} мс")
+    json_time = _timed(lambda: [json.loads(d) for d in json_encoded])
+    binary_time = _timed(lambda: [decode_command(d) for d in binary_encoded])
+    print(f"  декодирование  : JSON {json_time * 1000:8.1f} мс | binary {binary_time * 1000:8.1f} мс")
+    json_size = sum(map(len, json_encoded))
+    binary_size = sum(map(len, binary_encoded))
+    print(f"  размер записей : JSON {json_size:10d} Б | binary {binary_size:10d} Б (x{json_size / binary_size:.2f})")
+
+    network = SMRNetwork(nodes_count=args.nodes)
+    for node in network.nodes:
+        node.log = list(commands)
+        for cmd in commands:
+            node.apply_command(cmd)
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "data.json")
+        binary_path = os.path.join(directory, "data.bin")
+        json_time = _timed(lambda: network.save_to_file(json_path))
+        binary_time = _timed(lambda: network.save_binary(binary_path))
+        json_size = os.path.getsize(json_path)
+        binary_size = os.path.getsize(binary_path)
+    print(f"  сохранение     : JSON {json_time * 1000:8.1f} мс | binary {binary_time * 1000:8.1f} мс")
+    print(f"  размер файла   : JSON {json_size:10d} Б | binary {binary_size:10d} Б (x{json_size / binary_size:.2f})")
+
+
+def bench_wal(args) -> None:
+    commands = [{"key": f"key{i % args.keys}", "value": i} for i in range(args.commands)]
+    print(f"[Бенчмарк] WAL: {args.commands} команд, {args.nodes} узлов")
+    for policy in WAL_SYNC_POLICIES:
+        with tempfile.TemporaryDirectory() as directory:
+            network = SMRNetwork(nodes_count=args.nodes, wal_dir=directory, wal_sync=policy)
+            single = _timed(lambda: [network.run_consensus(cmd) for cmd in commands[:args.single]])
+            batch = _timed(lambda: network.run_consensus_batch(commands, max_batch_size=args.batch_size))
+            network.close()
+            replay = _timed(lambda: SMRNetwork(nodes_count=args.nodes, wal_dir=directory).close())
+        print(f"  {policy:6}: по одной {args.single / single:10.0f} ком/с | пакетами {args.commands / batch:10.0f} ком/с "
+              f"| воспроизведение {replay * 1000:8.1f} мс")
+
+
+async def _measure_cluster(nodes: int, args) -> dict:
+    cluster = AsyncSMRCluster(nodes_count=nodes, timeout=args.timeout, loss_rate=args.loss,
+                              delay=args.delay, jitter=args.jitter, seed=0)
+    await cluster.start()
+    latencies = []
+    for i in range(args.commands):
+        started = time.perf_counter()
+        await cluster.run_consensus({"key": f"key{i % 100}", "value": i})
+        latencies.append(time.perf_counter() - started)
+    commands = [{"key": f"key{i % 100}", "value": i} for i in range(args.batch_commands)]
+    started = time.perf_counter()
+    await cluster.run_consensus_batch(commands, max_batch_size=args.batch_size, max_in_flight=args.in_flight)
+    batch_time = time.perf_counter() - started
+    await cluster.close()
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "throughput": args.batch_commands / batch_time,
+        "messages": cluster.transport.sent,
+        "dropped": cluster.transport.dropped,
+    }
+
+
+def bench_cluster(args) -> None:
+    print(f"[Бенчмарк] Узлы-задачи asyncio: потеря {args.loss:.0%}, задержка {args.delay * 1000:.1f} мс")
+    for nodes in args.nodes:
+        result = asyncio.run(_measure_cluster(nodes, args))
+        print(f"  узлов {nodes:3d}: фиксация p50 {result['p50_ms']:7.3f} мс, p99 {result['p99_ms']:7.3f} мс | "
+              f"пакетами {result['throughput']:9.0f} ком/с | сообщений {result['messages']} "
+              f"(потеряно {result['dropped']})")
+
+
+def bench_read(args) -> None:
+    network = SMRNetwork(nodes_count=args.nodes)
+    network.run_consensus_batch([{"key": f"key{i}", "value": i} for i in range(args.keys)])
+    keys = [f"key{i % args.keys}" for i in range(args.reads)]
+    print(f"[Бенчмарк] {args.reads} чтений, состояние из {args.keys} ключей, {args.nodes} узлов")
+    copy_time = _timed(lambda: [network.nodes[network.leader_index].get_state().get(key) for key in keys])
+    print(f"  get_state()[key] : {args.reads / copy_time:12.0f} чтений/с")
+    for consistency in READ_CONSISTENCY:
+        elapsed = _timed(lambda: [network.read(key, consistency, node_idx=1) for key in keys])
+        print(f"  read({consistency:10}): {args.reads / elapsed:12.0f} чтений/с (x{copy_time / elapsed:.0f})")
+
+
+def _paced_latencies(submit, commit_index, count: int, interval: float) -> list:
+    """Подаёт команды с шагом interval и ждёт фиксации каждой; задержки в секундах"""
+    submitted = []
+    latencies = []
+    next_at = time.perf_counter()
+    i = 0
+    while len(latencies) < count:
+        now = time.perf_counter()
+        if i < count and now >= next_at:
+            submitted.append((submit({"key": f"key{i % 100}", "value": i}), now))
+            next_at += interval
+            i += 1
+        committed = commit_index()
+        while len(latencies) < len(submitted) and submitted[len(latencies)][0] < committed:
+            latencies.append(time.perf_counter() - submitted[len(latencies)][1])
+        time.sleep(0.0001)
+    return sorted(latencies)
+
+
+def bench_batcher(args) -> None:
+    commands = [{"key": f"key{i % 100}", "value": i} for i in range(args.commands)]
+    print(f"[Бенчмарк] CommandBatcher: {args.nodes} узлов, пакет до {args.batch_size}, "
+          f"задержка до {args.max_delay * 1000:.1f} мс")
+
+    network = SMRNetwork(nodes_count=args.nodes)
+    single = _timed(lambda: [network.run_consensus(cmd) for cmd in commands])
+    network = SMRNetwork(nodes_count=args.nodes)
+    batcher = CommandBatcher(network, args.batch_size, args.max_delay, args.in_flight)
+    batched = _timed(lambda: ([batcher.submit(cmd) for cmd in commands], batcher.flush()))
+    print(f"  пропускная способность: по одной {args.commands / single:10.0f} ком/с | "
+          f"батчер {args.commands / batched:10.0f} ком/с (x{single / batched:.1f})")
+
+    network = SMRNetwork(nodes_count=args.nodes)
+    batcher = CommandBatcher(network, args.batch_size, args.max_delay, args.in_flight)
+    leader = network.nodes[network.leader_index]
+    latencies = _paced_latencies(batcher.submit, lambda: leader.commit_index, args.latency_commands, 1 / args.rate)
+    batcher.close()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"  фиксация при {args.rate:.0f} ком/с: p50 {p50:7.3f} мс, p99 {p99:7.3f} мс, "
+          f"максимум {latencies[-1] * 1000:7.3f} мс")
+
+
+def bench_shards(args) -> None:
+    commands = [{"key": f"key{i % args.keys}", "value": i} for i in range(args.commands)]
+    print(f"[Бенчмарк] {args.commands} команд на {args.total_nodes} узлах, разбитых на группы")
+    for groups in args.groups:
+        sharded = ShardedSMR(groups, max(1, args.total_nodes // groups), args.shards)
+        batch = _timed(lambda: sharded.run_consensus_batch(commands))
+        single = _timed(lambda: [sharded.run_consensus(cmd) for cmd in commands[:args.single]])
+        print(f"  групп {groups:2d} по {sharded.nodes_per_group:2d} узла: пакетами {args.commands / batch:10.0f} ком/с | "
+              f"по одной {args.single / single:10.0f} ком/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки SMR-сети")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serialize_parser = subparsers.add_parser("serialize", help="JSON против бинарного формата журнала")
+    serialize_parser.add_argument("--commands", type=int, default=100000)
+    serialize_parser.add_argument("--keys", type=int, default=1000)
+    serialize_parser.add_argument("--nodes", type=int, default=5)
+    serialize_parser.set_defaults(func=bench_serialize)
+
+    wal_parser = subparsers.add_parser("wal", help="стоимость WAL при разных политиках fsync")
+    wal_parser.add_argument("--commands", type=int, default=20000)
+    wal_parser.add_argument("--single", type=int, default=500, help="сколько команд отправить по одной")
+    wal_parser.add_argument("--batch-size", type=int, default=64)
+    wal_parser.add_argument("--keys", type=int, default=1000)
+    wal_parser.add_argument("--nodes", type=int, default=5)
+    wal_parser.set_defaults(func=bench_wal)
+
+    cluster_parser = subparsers.add_parser("cluster", help="задержка и пропускная способность кластера на сообщениях")
+    cluster_parser.add_argument("--nodes", type=int, nargs="+", default=[3, 5, 10, 20, 50])
+    cluster_parser.add_argument("--commands", type=int, default=500, help="команд по одной для замера задержки")
+    cluster_parser.add_argument("--batch-commands", type=int, default=10000)
+    cluster_parser.add_argument("--batch-size", type=int, default=64)
+    cluster_parser.add_argument("--in-flight", type=int, default=4)
+    cluster_parser.add_argument("--timeout", type=float, default=0.05, help="таймаут повторной отправки, с")
+    cluster_parser.add_argument("--loss", type=float, default=0.0, help="доля теряемых сообщений")
+    cluster_parser.add_argument("--delay", type=float, default=0.0, help="задержка доставки, с")
+    cluster_parser.add_argument("--jitter", type=float, default=0.0)
+    cluster_parser.set_defaults(func=bench_cluster)
+
+    read_parser = subparsers.add_parser("read", help="чтение ключа при разных уровнях согласованности")
+    read_parser.add_argument("--reads", type=int, default=20000)
+    read_parser.add_argument("--keys", type=int, default=10000)
+    read_parser.add_argument("--nodes", type=int, default=5)
+    read_parser.set_defaults(func=bench_read)
+
+    batcher_parser = subparsers.add_parser("batcher", help="CommandBatcher: пропускная способность и задержка фиксации")
+    batcher_parser.add_argument("--commands", type=int, default=20000)
+    batcher_parser.add_argument("--latency-commands", type=int, default=2000, help="команд в замере задержки")
+    batcher_parser.add_argument("--rate", type=float, default=2000, help="темп подачи команд в замере задержки, ком/с")
+    batcher_parser.add_argument("--batch-size", type=int, default=64)
+    batcher_parser.add_argument("--max-delay", type=float, default=0.005, help="предел ожидания команды в пакете, с")
+    batcher_parser.add_argument("--in-flight", type=int, default=4)
+    batcher_parser.add_argument("--nodes", type=int, default=5)
+    batcher_parser.set_defaults(func=bench_batcher)
+
+    shards_parser = subparsers.add_parser("shards", help="пропускная способность при разном числе групп")
+    shards_parser.add_argument("--commands", type=int, default=30000)
+    shards_parser.add_argument("--single", type=int, default=3000, help="сколько команд отправить по одной")
+    shards_parser.add_argument("--keys", type=int, default=1000)
+    shards_parser.add_argument("--total-nodes", type=int, default=15)
+    shards_parser.add_argument("--groups", type=int, nargs="+", default=[1, 3, 5])
+    shards_parser.add_argument("--shards", type=int, default=60)
+    shards_parser.set_defaults(func=bench_shards)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
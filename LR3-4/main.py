@@ -1,9 +1,212 @@
+import asyncio
 import json
+import os
+import random
+import struct
+import threading
 import time
+import zlib
+from collections import deque
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 
 
+# ==============================
+# Компактная бинарная сериализация команд журнала
+# ==============================
+# Целые фиксированной ширины, строки с префиксом длины, значение — с тегом типа.
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+_VALUE_NONE, _VALUE_INT, _VALUE_FLOAT, _VALUE_STR, _VALUE_BOOL = range(5)
+BINARY_FILE_MAGIC = b'SMR3'
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    return _U32.pack(len(data)) + data
+
+
+def _unpack_str(data: bytes, offset: int) -> tuple:
+    (length,) = _U32.unpack_from(data, offset)
+    offset += _U32.size
+    return data[offset:offset + length].decode(), offset + length
+
+
+def encode_value(value) -> bytes:
+    if value is None:
+        return _U8.pack(_VALUE_NONE)
+    if isinstance(value, bool):
+        return _U8.pack(_VALUE_BOOL) + _U8.pack(value)
+    if isinstance(value, int):
+        return _U8.pack(_VALUE_INT) + _I64.pack(value)
+    if isinstance(value, float):
+        return _U8.pack(_VALUE_FLOAT) + _F64.pack(value)
+    return _U8.pack(_VALUE_STR) + _pack_str(str(value))
+
+
+def decode_value(data: bytes, offset: int) -> tuple:
+    (tag,) = _U8.unpack_from(data, offset)
+    offset += _U8.size
+    if tag == _VALUE_NONE:
+        return None, offset
+    if tag == _VALUE_BOOL:
+        return bool(data[offset]), offset + 1
+    if tag == _VALUE_INT:
+        return _I64.unpack_from(data, offset)[0], offset + _I64.size
+    if tag == _VALUE_FLOAT:
+        return _F64.unpack_from(data, offset)[0], offset + _F64.size
+    return _unpack_str(data, offset)
+
+
+def encode_command(command: dict) -> bytes:
+    """Команда журнала {"key": ..., "value": ...} в бинарном виде"""
+    return encode_value(command.get("key")) + encode_value(command.get("value"))
+
+
+def decode_command(data: bytes, offset: int = 0) -> tuple:
+    """Возвращает команду и позицию сразу за ней"""
+    key, offset = decode_value(data, offset)
+    value, offset = decode_value(data, offset)
+    return {"key": key, "value": value}, offset
+
+
+# ==============================
+# Журнал упреждающей записи (WAL) узла
+# ==============================
+# Запись: u32 длина полезной части, u32 CRC32, затем u8 тип и тело.
+# Сбой посреди записи оставляет «оборванный» хвост — при воспроизведении
+# он отбрасывается по длине или контрольной сумме.
+_WAL_HEADER = struct.Struct('>II')
+_WAL_ENTRIES, _WAL_COMMIT, _WAL_SNAPSHOT = range(3)
+WAL_SYNC_POLICIES = ("always", "group", "none")
+
+
+class WriteAheadLog:
+    """Дописываемый файл изменений журнала одного узла.
+
+    sync="always" — fsync после каждой записи; "group" — записи копятся
+    в буфере и сбрасываются одним fsync в точке фиксации (групповая
+    фиксация) или когда буфер превысил group_bytes; "none" — без fsync,
+    данные отдаются ОС в тех же точках.
+    """
+
+    def __init__(self, path: str, sync: str = "group", group_bytes: int = 1 << 20):
+        if sync not in WAL_SYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика синхронизации: {sync}")
+        self.path = path
+        self.sync_policy = sync
+        self.group_bytes = group_bytes
+        self.buffer = []
+        self.buffered = 0
+        self.file = open(path, 'ab')
+
+    def _append(self, payload: bytes):
+        self.buffer.append(_WAL_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self.buffered += len(payload) + _WAL_HEADER.size
+        if self.sync_policy == "always" or self.buffered >= self.group_bytes:
+            self.sync()
+
+    def log_entries(self, prev_index: int, entries: list):
+        """Журнал узла обрезается до prev_index и дополняется entries"""
+        self._append(b''.join(
+            [_U8.pack(_WAL_ENTRIES), _U32.pack(prev_index), _U32.pack(len(entries))]
+            + [encode_command(cmd) for cmd in entries]
+        ))
+
+    def log_commit(self, commit_index: int):
+        self._append(_U8.pack(_WAL_COMMIT) + _U32.pack(commit_index))
+
+    def sync(self):
+        """Одна последовательная запись всего буфера и (по политике) один fsync"""
+        if self.buffer:
+            self.file.write(b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+        self.file.flush()
+        if self.sync_policy != "none":
+            os.fsync(self.file.fileno())
+
+    def rewrite(self, node: 'Node'):
+        """Заменяет файл снимком и хвостом журнала узла (после take_snapshot).
+
+        Новый файл пишется рядом и подменяет старый атомарно, так что
+        после сбоя на диске остаётся одна из двух полных версий.
+        """
+        snapshot = [_U8.pack(_WAL_SNAPSHOT), _U32.pack(node.snapshot_index), _U32.pack(len(node.state))]
+        snapshot.extend(encode_value(key) + encode_value(value) for key, value in node.state.items())
+        records = [b''.join(snapshot)]
+        if node.log:
+            records.append(b''.join(
+                [_U8.pack(_WAL_ENTRIES), _U32.pack(node.snapshot_index), _U32.pack(len(node.log))]
+                + [encode_command(cmd) for cmd in node.log]
+            ))
+        if node.commit_index > node.snapshot_index:
+            records.append(_U8.pack(_WAL_COMMIT) + _U32.pack(node.commit_index))
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for payload in records:
+                f.write(_WAL_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, 'ab')
+        self.buffer = []
+        self.buffered = 0
+
+    def replay(self, node: 'Node') -> int:
+        """Восстанавливает журнал, снимок и commit_index узла из файла.
+
+        Чтение останавливается на первой повреждённой записи, и файл
+        обрезается до неё. Возвращает число воспроизведённых записей.
+        """
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        wal, node.wal = node.wal, None  # при воспроизведении ничего не дописываем
+        offset = 0
+        replayed = 0
+        while offset + _WAL_HEADER.size <= len(data):
+            length, checksum = _WAL_HEADER.unpack_from(data, offset)
+            start = offset + _WAL_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            kind = payload[0]
+            if kind == _WAL_ENTRIES:
+                prev_index, count = struct.unpack_from('>II', payload, 1)
+                position = 9
+                entries = []
+                for _ in range(count):
+                    cmd, position = decode_command(payload, position)
+                    entries.append(cmd)
+                node.append_entries(prev_index, entries, node.commit_index)
+            elif kind == _WAL_COMMIT:
+                node.advance_commit(_U32.unpack_from(payload, 1)[0])
+            elif kind == _WAL_SNAPSHOT:
+                index, state_len = struct.unpack_from('>II', payload, 1)
+                position = 9
+                state = {}
+                for _ in range(state_len):
+                    key, position = decode_value(payload, position)
+                    state[key], position = decode_value(payload, position)
+                node.install_snapshot(index, state)
+            offset = start + length
+            replayed += 1
+        node.wal = wal
+        if offset < len(data):
+            print(f"[WAL] {self.path}: отброшен повреждённый хвост {len(data) - offset} Б")
+            self.file.truncate(offset)
+        return replayed
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
 # ==============================
 # Класс для хранения истории действий
 # ==============================
@@ -31,10 +234,14 @@ class ActionHistory:
 class Node:
     def __init__(self, node_id: int):
         self.node_id = node_id
-        self.log = []  # журнал команд
+        self.log = []  # журнал команд после снимка
+        self.snapshot_index = 0  # сколько записей журнала свёрнуто в снимок
         self.state = {}  # текущее состояние
         self.leader = False  # является ли лидером
         self.active = True  # активен ли узел
+        self.commit_index = 0  # сколько записей журнала зафиксировано
+        self.last_applied = 0  # сколько записей применено к состоянию
+        self.wal = None  # WriteAheadLog, если узел хранит журнал на диске
 
     def apply_command(self, command: dict):
         key = command.get("key")
@@ -46,17 +253,85 @@ class Node:
             return f"[Узел {self.node_id}] Неверная команда"
 
     def append_log(self, command: dict):
-        self.log.append(command)
+        self.append_commands([command])
+
+    def append_commands(self, commands: list):
+        if self.wal:
+            self.wal.log_entries(self.last_index(), commands)
+        self.log.extend(commands)
+
+    def append_entries(self, prev_index: int, entries: list, leader_commit: int):
+        """Приём записей от лидера (как AppendEntries в Raft).
+
+        prev_index — сколько записей журнала должно предшествовать entries.
+        Возвращает (успех, длина журнала); при отставании лидер повторит
+        отправку с позиции, равной длине нашего журнала.
+        """
+        if self.last_index() < prev_index:
+            return False, self.last_index()
+        if prev_index < self.commit_index:
+            # Зафиксированные записи (и свёрнутый снимок) не переписываются:
+            # пропускаем начало пакета, которое у нас уже зафиксировано
+            entries = entries[self.commit_index - prev_index:]
+            prev_index = self.commit_index
+        if self.wal and (entries or prev_index < self.last_index()):
+            self.wal.log_entries(prev_index, entries)
+        del self.log[prev_index - self.snapshot_index:]
+        self.log.extend(entries)
+        self.advance_commit(min(leader_commit, self.last_index()))
+        return True, self.last_index()
+
+    def advance_commit(self, commit_index: int):
+        """Применяет только записи между last_applied и commit_index"""
+        if commit_index > self.commit_index:
+            self.commit_index = commit_index
+            if self.wal:
+                self.wal.log_commit(commit_index)
+        while self.last_applied < self.commit_index:
+            self.apply_command(self.log[self.last_applied - self.snapshot_index])
+            self.last_applied += 1
+
+    def last_index(self) -> int:
+        """Длина журнала с учётом свёрнутой в снимок части"""
+        return self.snapshot_index + len(self.log)
+
+    def entries_from(self, index: int) -> list:
+        return self.log[index - self.snapshot_index:]
+
+    def take_snapshot(self):
+        """Сворачивает применённый префикс журнала: его заменяет само состояние"""
+        del self.log[:self.last_applied - self.snapshot_index]
+        self.snapshot_index = self.last_applied
+        if self.wal:
+            self.wal.rewrite(self)
+
+    def install_snapshot(self, index: int, state: dict):
+        """Принимает снимок состояния лидера на позиции index вместо его истории"""
+        self.state = dict(state)
+        self.log = []
+        self.snapshot_index = index
+        self.commit_index = index
+        self.last_applied = index
+        if self.wal:
+            self.wal.rewrite(self)
 
     def get_state(self):
         return self.state.copy()
 
+    def read(self, key, default=None):
+        """Значение одного ключа без копирования всего состояния"""
+        return self.state.get(key, default)
+
     def to_dict(self):
         return {
             "node_id": self.node_id,
             "log": self.log,
+            "snapshot_index": self.snapshot_index,
             "state": self.state,
-            "leader": self.leader
+            "leader": self.leader,
+            "active": self.active,
+            "commit_index": self.commit_index,
+            "last_applied": self.last_applied
         }
 
     def set_leader(self, is_leader: bool):
@@ -75,62 +350,207 @@ class Node:
 # ==============================
 # Менеджер узлов и консенсуса
 # ==============================
+# Уровни согласованности чтения: "lease" — лидер отвечает сам, пока действует
+# аренда, подтверждённая большинством; "read_index" — лидер подтверждает
+# лидерство раундом пульса (без записи в журнал); "stale" — ответ узла,
+# отстающего от лидера не больше допустимого.
+READ_CONSISTENCY = ("lease", "read_index", "stale")
+
+
 class SMRNetwork:
-    def __init__(self, nodes_count: int = 5):
-        self.nodes: list[Node] = [Node(i) for i in range(nodes_count)]
-        self.nodes_count = nodes_count
+    def __init__(self, nodes_count: int = 5, snapshot_threshold: int = 1000,
+                 wal_dir: str = None, wal_sync: str = "group", lease_duration: float = 0.1, nodes: list = None):
+        # nodes — готовые узлы (например, резерв ShardedSMR); их node_id — позиции в списке
+        self.nodes: list[Node] = nodes if nodes is not None else [Node(i) for i in range(nodes_count)]
+        self.nodes_count = len(self.nodes)
         self.leader_index = 0
         self.nodes[self.leader_index].set_leader(True)
+        # Узел делает снимок, когда хвост журнала дорастает до этого размера
+        self.snapshot_threshold = snapshot_threshold
+        # Что лидер знает о журналах последователей: откуда слать и сколько подтверждено
+        self.next_index: dict[int, int] = {}
+        self.match_index: dict[int, int] = {}
+        # Пока аренда не истекла, лидер читает без раунда к большинству
+        self.lease_duration = lease_duration
+        self.lease_until = 0.0
+        # Каталог с WAL узлов; существующие файлы воспроизводятся при старте
+        self.wal_dir = wal_dir
+        self.wal_sync = wal_sync
+        if wal_dir:
+            os.makedirs(wal_dir, exist_ok=True)
+            for node in self.nodes:
+                self.attach_wal(node)
+            # После воспроизведения узел 0 мог оказаться отставшим:
+            # лидером становится узел с самым полным журналом, как в change_leader
+            leader = max(self.nodes, key=lambda node: (node.commit_index, node.last_index()))
+            self.nodes[self.leader_index].set_leader(False)
+            self.leader_index = leader.node_id
+            leader.set_leader(True)
 
-    def broadcast_command(self, command: dict):
-        for node in self.nodes:
-            if node.is_active() and not node.leader:
-                node.append_log(command)
+    def attach_wal(self, node: Node, replay: bool = True):
+        """Подключает к узлу его WAL. replay=False перезаписывает файл
+        текущим содержимым узла (например, после load_from_file)."""
+        if node.wal:
+            node.wal.close()
+        node.wal = WriteAheadLog(os.path.join(self.wal_dir, f"node_{node.node_id}.wal"), self.wal_sync)
+        if replay:
+            node.wal.replay(node)
+        else:
+            node.wal.rewrite(node)
 
-    def commit_commands(self):
-        logs = [n.log for n in self.nodes if n.is_active()]
-        log_lengths = [len(log) for log in logs]
-        if not log_lengths:
-            return
+    def sync_wals(self):
+        for node in self.nodes:
+            if node.wal:
+                node.wal.sync()
 
-        min_len = min(log_lengths)
-        commands_to_commit = []
+    def close(self):
+        for node in self.nodes:
+            if node.wal:
+                node.wal.close()
+                node.wal = None
 
-        for i in range(min_len):
-            current_commands = [log[i] for log in logs if len(log) > i]
-            if all(cmd == current_commands[0] for cmd in current_commands):
-                commands_to_commit.append(current_commands[0])
+    def broadcast_command(self, command: dict):
+        self.broadcast_commands([command])
 
+    def broadcast_commands(self, commands: list):
+        """Один раунд репликации: все команды уходят последователю одним сообщением"""
+        leader = self.nodes[self.leader_index]
+        leader.append_commands(commands)
         for node in self.nodes:
-            if not node.is_active():
-                continue
-            node.log = node.log[:len(commands_to_commit)]
-            for cmd in commands_to_commit[len(node.state):]:
-                msg = node.apply_command(cmd)
+            if node.is_active() and not node.leader:
+                self.replicate(node)
+
+    def replicate(self, node: Node):
+        """Досылает последователю записи с его next_index. Для актуального
+        последователя это одна новая запись, независимо от длины истории."""
+        leader = self.nodes[self.leader_index]
+        # Новому для лидера последователю шлём всё после его commit_index:
+        # незафиксированный хвост мог разойтись с журналом лидера
+        start = self.next_index.get(node.node_id, min(node.commit_index, leader.last_index()))
+        while True:
+            if start < leader.snapshot_index:
+                # Нужные записи уже свёрнуты: передаём снимок состояния и хвост после него
+                node.install_snapshot(leader.last_applied, leader.state)
+                start = leader.last_applied
+            ok, length = node.append_entries(start, leader.entries_from(start), leader.commit_index)
+            if ok:
+                break
+            start = length
+        self.next_index[node.node_id] = length
+        self.match_index[node.node_id] = length
+
+    def commit_commands(self):
+        """Сдвигает commit_index до позиции, подтверждённой большинством кластера"""
+        leader = self.nodes[self.leader_index]
+        matches = sorted(
+            [leader.last_index()] + [self.match_index.get(n.node_id, 0) for n in self.nodes if not n.leader],
+            reverse=True
+        )
+        # Последователь может подтвердить больше, чем есть у лидера, — фиксировать
+        # можно только то, что лежит в журнале самого лидера
+        majority_index = min(matches[self.nodes_count // 2], leader.last_index())
+        if majority_index == leader.last_index():
+            # Весь журнал лидера подтверждён большинством — продлеваем аренду
+            self.lease_until = time.monotonic() + self.lease_duration
+        if majority_index > leader.commit_index:
+            leader.advance_commit(majority_index)
+            for node in self.nodes:
+                if node.is_active() and not node.leader:
+                    node.advance_commit(min(leader.commit_index, self.match_index.get(node.node_id, 0)))
+                if node.is_active() and len(node.log) >= self.snapshot_threshold:
+                    node.take_snapshot()
+        # Групповая фиксация: все записи раунда уходят на диск одним fsync на узел
+        self.sync_wals()
 
     def add_node(self):
         new_id = self.nodes_count
         self.nodes.append(Node(new_id))
         self.nodes_count += 1
+        if self.wal_dir:
+            self.attach_wal(self.nodes[-1])
+        if self.nodes[self.leader_index].is_active():
+            # Новый узел сразу догоняет журнал, иначе он может стать лидером пустым
+            self.replicate(self.nodes[-1])
         return new_id
 
     def change_leader(self):
-        new_leader_idx = (self.leader_index + 1) % self.nodes_count
-        while not self.nodes[new_leader_idx].is_active():
-            new_leader_idx = (new_leader_idx + 1) % self.nodes_count
-        old_leader = self.leader_index
-        self.nodes[old_leader].set_leader(False)
-        self.leader_index = new_leader_idx
+        """Лидером становится активный узел с самым полным журналом: только он
+        гарантированно хранит все зафиксированные записи. При равенстве —
+        следующий по кругу после текущего лидера."""
+        order = [self.nodes[(self.leader_index + 1 + i) % self.nodes_count] for i in range(self.nodes_count)]
+        candidates = [node for node in order if node.is_active()]
+        if not candidates:
+            raise RuntimeError("Нет активных узлов")
+        new_leader = max(candidates, key=lambda node: (node.commit_index, node.last_index()))
+        self.nodes[self.leader_index].set_leader(False)
+        self.leader_index = new_leader.node_id
         self.nodes[self.leader_index].set_leader(True)
+        # Новый лидер заново узнаёт позиции последователей из их ответов
+        self.next_index = {}
+        self.match_index = {}
+        self.lease_until = 0.0
+
+    def read(self, key, consistency: str = "lease", node_idx: int = None, max_lag: int = 0):
+        """Читает один ключ, не копируя состояние и не добавляя записей в журнал.
+
+        Для "stale" отвечает узел node_idx (по умолчанию лидер), если он
+        применил журнал с отставанием не больше max_lag записей.
+        Просроченная аренда превращает "lease" в "read_index".
+        """
+        if consistency not in READ_CONSISTENCY:
+            raise ValueError(f"Неизвестный уровень согласованности: {consistency}")
+        leader = self.nodes[self.leader_index]
+        if consistency == "stale":
+            node = leader if node_idx is None else self.nodes[node_idx]
+            if leader.commit_index - node.last_applied > max_lag:
+                raise RuntimeError(f"Узел {node.node_id} отстал больше чем на {max_lag} записей")
+            return node.read(key)
+
+        if not leader.is_active():
+            self.change_leader()
+            leader = self.nodes[self.leader_index]
+        if consistency == "lease" and time.monotonic() < self.lease_until:
+            return leader.read(key)
+        # read_index: лидер применяет всё зафиксированное сразу, поэтому
+        # достаточно убедиться, что большинство всё ещё признаёт его лидером
+        if not self.confirm_leadership():
+            raise RuntimeError("Лидерство не подтверждено большинством")
+        return leader.read(key)
+
+    def confirm_leadership(self) -> bool:
+        """Раунд пульса без новых записей; при успехе продлевает аренду"""
+        acks = 1
+        for node in self.nodes:
+            if node.is_active() and not node.leader:
+                self.replicate(node)
+                acks += 1
+        if acks <= self.nodes_count // 2:
+            return False
+        self.lease_until = time.monotonic() + self.lease_duration
+        return True
 
     def network_partition(self, partitioned_nodes: list):
         for idx in partitioned_nodes:
             self.nodes[idx].deactivate()
 
     def recover_partitioned_node(self, node_idx: int):
-        latest_state = self.nodes[self.leader_index].get_state()
-        self.nodes[node_idx].state = latest_state.copy()
-        self.nodes[node_idx].activate()
+        node = self.nodes[node_idx]
+        node.activate()
+        leader = self.nodes[self.leader_index]
+        if not leader.is_active() or (
+            (node.commit_index, node.last_index()) > (leader.commit_index, leader.last_index())
+        ):
+            # Вернулся узел полнее лидера: лидерство переходит к нему,
+            # а остальные догоняют его журнал
+            self.change_leader()
+            for other in self.nodes:
+                if other.is_active() and not other.leader:
+                    self.replicate(other)
+            self.commit_commands()
+        elif not node.leader:
+            # Догоняем отставший журнал с лидера и применяем зафиксированное
+            self.replicate(node)
+            self.commit_commands()
 
     def run_consensus(self, command: dict):
         try:
@@ -144,6 +564,33 @@ class SMRNetwork:
         except Exception as e:
             print(f"[Ошибка] При выполнении консенсуса: {e}")
 
+    def run_consensus_batch(self, commands: list, max_batch_size: int = 64, max_in_flight: int = 4):
+        """Реплицирует команды пакетами по max_batch_size за раунд.
+
+        До max_in_flight пакетов отправляются, не дожидаясь фиксации
+        предыдущих; commit_index затем сдвигается один раз на все сразу.
+        Порядок команд в журнале совпадает с порядком во входном списке,
+        поэтому результат такой же, как у последовательных run_consensus.
+        Возвращает commit_index лидера.
+        """
+        try:
+            leader = self.nodes[self.leader_index]
+            if not leader.is_active():
+                self.change_leader()
+                leader = self.nodes[self.leader_index]
+
+            in_flight = 0
+            for start in range(0, len(commands), max_batch_size):
+                self.broadcast_commands(commands[start:start + max_batch_size])
+                in_flight += 1
+                if in_flight >= max_in_flight:
+                    self.commit_commands()
+                    in_flight = 0
+            self.commit_commands()
+            return leader.commit_index
+        except Exception as e:
+            print(f"[Ошибка] При выполнении консенсуса: {e}")
+
     def save_to_file(self, filename="blockchain_data.json"):
         data = {
             "nodes": [node.to_dict() for node in self.nodes],
@@ -152,10 +599,69 @@ class SMRNetwork:
         with open(filename, 'w') as f:
             json.dump(data, f, indent=4)
 
+    def save_binary(self, filename="blockchain_data.bin"):
+        parts = [BINARY_FILE_MAGIC, _U32.pack(self.leader_index), _U32.pack(len(self.nodes))]
+        for node in self.nodes:
+            parts.append(_U32.pack(node.node_id))
+            parts.append(_U8.pack(int(node.leader) | int(node.is_active()) << 1))
+            parts.append(struct.pack('>III', node.snapshot_index, node.commit_index, node.last_applied))
+            parts.append(_U32.pack(len(node.log)))
+            parts.extend(encode_command(cmd) for cmd in node.log)
+            parts.append(_U32.pack(len(node.state)))
+            for key, value in node.state.items():
+                parts.append(encode_value(key) + encode_value(value))
+        with open(filename, 'wb') as f:
+            f.write(b''.join(parts))
+
+    def load_binary(self, filename="blockchain_data.bin"):
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            print("[Ошибка] Файл не найден при попытке загрузки")
+            return
+        if data[:4] != BINARY_FILE_MAGIC:
+            raise ValueError("Неизвестный формат файла")
+        leader_index, nodes_count = struct.unpack_from('>II', data, 4)
+        offset = 12
+        self.close()
+        self.nodes = []
+        for _ in range(nodes_count):
+            node_id, flags, snapshot_index, commit_index, last_applied, log_len = struct.unpack_from(
+                '>IBIIII', data, offset
+            )
+            offset += 21
+            node = Node(node_id)
+            node.snapshot_index = snapshot_index
+            node.commit_index, node.last_applied = commit_index, last_applied
+            for _ in range(log_len):
+                cmd, offset = decode_command(data, offset)
+                node.log.append(cmd)
+            (state_len,) = _U32.unpack_from(data, offset)
+            offset += _U32.size
+            for _ in range(state_len):
+                key, offset = decode_value(data, offset)
+                node.state[key], offset = decode_value(data, offset)
+            node.set_leader(bool(flags & 1))
+            node.activate() if flags & 2 else node.deactivate()
+            self.nodes.append(node)
+        self.leader_index = leader_index
+        self.nodes_count = len(self.nodes)
+        self.next_index = {}
+        self.match_index = {}
+        self._rewrite_wals()
+
+    def _rewrite_wals(self):
+        """После загрузки из файла WAL узлов начинаются с загруженного состояния"""
+        if self.wal_dir:
+            for node in self.nodes:
+                self.attach_wal(node, replay=False)
+
     def load_from_file(self, filename="blockchain_data.json"):
         try:
             with open(filename, 'r') as f:
                 data = json.load(f)
+            self.close()
             self.nodes = []
             for node_data in data["nodes"]:
                 node = Node(node_data["node_id"])
@@ -163,13 +669,569 @@ class SMRNetwork:
                 node.state = node_data["state"]
                 node.set_leader(node_data["leader"])
                 node.activate() if node_data.get("active", True) else node.deactivate()
+                # Старые файлы не хранят позиции: считаем журнал применённым
+                node.snapshot_index = node_data.get("snapshot_index", 0)
+                node.commit_index = node_data.get("commit_index", node.last_index())
+                node.last_applied = node_data.get("last_applied", node.commit_index)
                 self.nodes.append(node)
             self.leader_index = data["leader_index"]
             self.nodes_count = len(self.nodes)
+            self.next_index = {}
+            self.match_index = {}
+            self._rewrite_wals()
         except FileNotFoundError:
             print("[Ошибка] Файл не найден при попытке загрузки")
 
 
+# ==============================
+# Пакетирование команд при потоковой записи
+# ==============================
+class CommandBatcher:
+    """Копит команды и отправляет их в SMRNetwork пакетами.
+
+    Пакет уходит, когда набралось max_batch_size команд; неполный пакет
+    и отправленные, но не зафиксированные пакеты фиксирует таймер не
+    позже чем через max_delay секунд после первой ожидающей команды.
+    submit() возвращает позицию команды в журнале лидера: команда
+    применена, когда commit_index её превысил. Таймер работает в своём
+    потоке, поэтому, пока батчер открыт, к сети обращается только он.
+    """
+
+    def __init__(self, network: SMRNetwork, max_batch_size: int = 64, max_delay: float = 0.005, max_in_flight: int = 4):
+        self.network = network
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_in_flight = max_in_flight
+        self.pending = []
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def submit(self, command: dict) -> int:
+        with self.lock:
+            leader = self.network.nodes[self.network.leader_index]
+            position = leader.last_index() + len(self.pending)
+            self.pending.append(command)
+            if len(self.pending) >= self.max_batch_size:
+                self._send()
+            self._arm_timer()
+            return position
+
+    def poll(self):
+        """Отправляет и фиксирует всё накопленное (так срабатывает таймер)"""
+        with self.lock:
+            if self.timer is threading.current_thread():
+                self.timer = None
+            self._commit()
+
+    def flush(self) -> int:
+        with self.lock:
+            self._cancel_timer()
+            self._commit()
+            return self.network.nodes[self.network.leader_index].commit_index
+
+    def close(self) -> int:
+        return self.flush()
+
+    def _arm_timer(self):
+        # Срок отсчитывается от первой незафиксированной команды и не сдвигается следующими
+        if self.timer is None and (self.pending or self.in_flight):
+            self.timer = threading.Timer(self.max_delay, self.poll)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _commit(self):
+        if self.pending:
+            self._send()
+        if self.in_flight:
+            self.network.commit_commands()
+            self.in_flight = 0
+
+    def _send(self):
+        network = self.network
+        if not network.nodes[network.leader_index].is_active():
+            network.change_leader()
+        network.broadcast_commands(self.pending)
+        self.pending = []
+        self.in_flight += 1
+        if self.in_flight >= self.max_in_flight:
+            network.commit_commands()
+            self.in_flight = 0
+            # Всё отправленное зафиксировано — старый срок таймера больше не нужен
+            if not self.pending:
+                self._cancel_timer()
+
+
+# ==============================
+# Шардирование ключей по независимым группам SMR
+# ==============================
+class ShardedSMR:
+    """Делит ключи команд между несколькими SMRNetwork, у каждой свой лидер.
+
+    Ключ хешируется в один из shards_count виртуальных шардов, а таблица
+    маршрутизации routing[шард] указывает группу. Команда реплицируется
+    только внутри своей группы, поэтому с ростом числа групп падает число
+    рассылок на команду и растёт суммарная пропускная способность.
+    """
+
+    def __init__(self, groups_count: int = 3, nodes_per_group: int = 3, shards_count: int = 64, **network_kwargs):
+        if groups_count < 1 or shards_count < groups_count:
+            raise ValueError("Нужна хотя бы одна группа и не меньше шардов, чем групп")
+        self.nodes_per_group = nodes_per_group
+        self.shards_count = shards_count
+        self.network_kwargs = network_kwargs
+        self.groups: list[SMRNetwork] = [self._make_group(i) for i in range(groups_count)]
+        self.routing = [shard % groups_count for shard in range(shards_count)]
+        self.spare_nodes: list[Node] = []  # добавленные узлы, которых пока не хватает на новую группу
+
+    def _make_group(self, index: int, nodes: list = None) -> SMRNetwork:
+        kwargs = dict(self.network_kwargs)
+        if kwargs.get("wal_dir"):
+            kwargs["wal_dir"] = os.path.join(kwargs["wal_dir"], f"group_{index}")
+        return SMRNetwork(nodes_count=self.nodes_per_group, nodes=nodes, **kwargs)
+
+    def shard_of(self, key) -> int:
+        # crc32, а не hash(): распределение не должно меняться между запусками
+        return zlib.crc32(str(key).encode()) % self.shards_count
+
+    def group_for(self, key) -> SMRNetwork:
+        return self.groups[self.routing[self.shard_of(key)]]
+
+    def run_consensus(self, command: dict):
+        self.group_for(command.get("key")).run_consensus(command)
+
+    def run_consensus_batch(self, commands: list, max_batch_size: int = 64, max_in_flight: int = 4) -> list:
+        """Раскладывает команды по группам с сохранением порядка внутри группы.
+        Возвращает commit_index лидера каждой группы."""
+        per_group = [[] for _ in self.groups]
+        for command in commands:
+            per_group[self.routing[self.shard_of(command.get("key"))]].append(command)
+        for group, group_commands in zip(self.groups, per_group):
+            if group_commands:
+                group.run_consensus_batch(group_commands, max_batch_size, max_in_flight)
+        return [group.nodes[group.leader_index].commit_index for group in self.groups]
+
+    def read(self, key, consistency: str = "lease", **kwargs):
+        return self.group_for(key).read(key, consistency, **kwargs)
+
+    def add_node(self) -> tuple:
+        """Добавляет узел в резерв; набрав nodes_per_group резервных узлов,
+        собирает из них новую группу и перераспределяет ей шарды.
+
+        Возвращает (индекс группы, id узла в группе); пока узел ждёт
+        в резерве, индекс группы равен None.
+        """
+        node = Node(len(self.spare_nodes))
+        self.spare_nodes.append(node)
+        if len(self.spare_nodes) < self.nodes_per_group:
+            return None, node.node_id
+        nodes, self.spare_nodes = self.spare_nodes, []
+        self.groups.append(self._make_group(len(self.groups), nodes))
+        self.rebalance()
+        return len(self.groups) - 1, node.node_id
+
+    def rebalance(self) -> int:
+        """Выравнивает число шардов на группу, перенося лишние в самые малые.
+
+        Данные шарда копируются в новую группу её же консенсусом, и только
+        потом меняется маршрут. Старые копии остаются в состоянии исходной
+        группы, но маршрутизация к ним больше не ведёт.
+        Возвращает число перенесённых шардов.
+        """
+        owned = [[] for _ in self.groups]
+        for shard, group_index in enumerate(self.routing):
+            owned[group_index].append(shard)
+        target, extra = divmod(self.shards_count, len(self.groups))
+        quotas = [target + (1 if i < extra else 0) for i in range(len(self.groups))]
+        # Группы, отдающие шарды, упорядочены по убыванию, принимающие — по возрастанию
+        donors = sorted(range(len(self.groups)), key=lambda i: len(owned[i]) - quotas[i], reverse=True)
+        moves = {}  # шард -> новая группа
+        for receiver in sorted(range(len(self.groups)), key=lambda i: len(owned[i]) - quotas[i]):
+            for donor in donors:
+                while len(owned[receiver]) < quotas[receiver] and len(owned[donor]) > quotas[donor]:
+                    shard = owned[donor].pop()
+                    owned[receiver].append(shard)
+                    moves[shard] = receiver
+
+        # Один проход по состоянию каждой отдающей группы
+        transfers = [[] for _ in self.groups]
+        for group_index in {self.routing[shard] for shard in moves}:
+            group = self.groups[group_index]
+            for key, value in group.nodes[group.leader_index].state.items():
+                receiver = moves.get(self.shard_of(key))
+                if receiver is not None and self.routing[self.shard_of(key)] == group_index:
+                    transfers[receiver].append({"key": key, "value": value})
+        for receiver, commands in enumerate(transfers):
+            if commands:
+                self.groups[receiver].run_consensus_batch(commands)
+        for shard, receiver in moves.items():
+            self.routing[shard] = receiver
+        return len(moves)
+
+    def close(self):
+        for group in self.groups:
+            group.close()
+
+
+# ==============================
+# Кластер с обменом сообщениями: каждый узел — своя задача asyncio
+# ==============================
+class MessageTransport:
+    """Доставляет сообщения между узлами через их почтовые ящики.
+
+    loss_rate — доля теряемых сообщений, delay и jitter — задержка доставки
+    в секундах. Сообщения к изолированным узлам и от них пропадают.
+    """
+
+    def __init__(self, loss_rate: float = 0.0, delay: float = 0.0, jitter: float = 0.0, seed=None):
+        self.loss_rate = loss_rate
+        self.delay = delay
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.inboxes: dict[int, asyncio.Queue] = {}
+        self.partitioned = set()
+        self.sent = 0
+        self.dropped = 0
+
+    def register(self, node_id: int) -> asyncio.Queue:
+        self.inboxes[node_id] = asyncio.Queue()
+        return self.inboxes[node_id]
+
+    def send(self, src: int, dst: int, message: tuple):
+        self.sent += 1
+        if src in self.partitioned or dst in self.partitioned or (
+                self.loss_rate and self.random.random() < self.loss_rate):
+            self.dropped += 1
+            return
+        delay = self.delay + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.inboxes[dst].put_nowait, message)
+        else:
+            self.inboxes[dst].put_nowait(message)
+
+
+class AsyncSMRCluster:
+    """Та же репликация, что в SMRNetwork, но узлы общаются только сообщениями.
+
+    Сообщения:
+      ("append", term, seq, leader_id, prev_index, entries, leader_commit, snapshot, sent_at)
+      ("ack", term, node_id, ok, length, sent_at)
+      ("client", commands, future), ("read", key, consistency, future, max_staleness)
+      и ("tick",) — запросы клиента и таймер лидера.
+    Каждое append несёт записи до конца журнала лидера, а последователь
+    отбрасывает сообщения со старыми (term, seq), поэтому потеря и
+    переупорядочивание лечатся повторной отправкой по таймауту.
+    """
+
+    def __init__(self, nodes_count: int = 5, timeout: float = 0.05, heartbeat_interval: float = 0.01,
+                 client_timeout: float = 5.0, snapshot_threshold: int = 1000, lease_duration: float = 0.04,
+                 loss_rate: float = 0.0, delay: float = 0.0, jitter: float = 0.0, seed=None):
+        self.nodes: list[Node] = [Node(i) for i in range(nodes_count)]
+        self.nodes_count = nodes_count
+        self.leader_index = 0
+        self.nodes[0].set_leader(True)
+        # Аренда считается от момента отправки подтверждённого сообщения
+        self.lease_duration = lease_duration
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.client_timeout = client_timeout
+        self.snapshot_threshold = snapshot_threshold
+        self.transport = MessageTransport(loss_rate, delay, jitter, seed)
+        self.tasks = []
+        # Состояние лидера текущего срока
+        self.term = 0
+        self.term_start = 0  # commit_index лидера на начало срока
+        self.next_index: dict[int, int] = {}
+        self.match_index: dict[int, int] = {}
+        self.synced = set()  # последователи, подтвердившие журнал в этом сроке
+        self.last_sent: dict[int, float] = {}
+        self.commit_sent: dict[int, int] = {}
+        self.seq: dict[int, int] = {}
+        self.waiters = deque()  # (позиция в журнале, future клиента)
+        self.acked_sent_at: dict[int, float] = {}  # отправка последнего подтверждённого сообщения
+        self.pending_reads = []  # (время начала раунда, ключ, future) для read_index
+        # Что видел каждый последователь: последние принятые (term, seq) и когда
+        self.received: dict[int, tuple] = {}
+        self.heard_at: dict[int, float] = {}
+
+    async def start(self):
+        for node in self.nodes:
+            inbox = self.transport.register(node.node_id)
+            self.tasks.append(asyncio.create_task(self._run_node(node, inbox)))
+        self.tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    # --- API клиента ---
+    async def submit(self, commands: list) -> int:
+        """Отправляет команды лидеру; возвращает commit_index после их фиксации"""
+        if not self.nodes[self.leader_index].is_active():
+            self.change_leader()
+        future = asyncio.get_running_loop().create_future()
+        self.transport.inboxes[self.leader_index].put_nowait(("client", commands, future))
+        return await asyncio.wait_for(future, self.client_timeout)
+
+    async def run_consensus(self, command: dict) -> int:
+        return await self.submit([command])
+
+    async def read(self, key, consistency: str = "lease", node_idx: int = None, max_staleness: float = 0.1):
+        """Читает один ключ без копирования состояния и без записи в журнал.
+
+        "stale" обслуживает узел node_idx (по умолчанию лидер), если он
+        слышал лидера не раньше max_staleness секунд назад.
+        """
+        if consistency not in READ_CONSISTENCY:
+            raise ValueError(f"Неизвестный уровень согласованности: {consistency}")
+        if consistency == "stale" and node_idx is not None:
+            target = node_idx
+        else:
+            if not self.nodes[self.leader_index].is_active():
+                self.change_leader()
+            target = self.leader_index
+        future = asyncio.get_running_loop().create_future()
+        self.transport.inboxes[target].put_nowait(("read", key, consistency, future, max_staleness))
+        return await asyncio.wait_for(future, self.client_timeout)
+
+    async def run_consensus_batch(self, commands: list, max_batch_size: int = 64, max_in_flight: int = 4) -> int:
+        """До max_in_flight пакетов реплицируются одновременно"""
+        in_flight = asyncio.Semaphore(max_in_flight)
+
+        async def send(batch):
+            async with in_flight:
+                return await self.submit(batch)
+
+        results = await asyncio.gather(*(
+            send(commands[start:start + max_batch_size]) for start in range(0, len(commands), max_batch_size)
+        ))
+        return max(results, default=self.nodes[self.leader_index].commit_index)
+
+    async def wait_for_sync(self, timeout: float = 5.0) -> bool:
+        """Ждёт, пока все активные узлы применят журнал лидера"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            leader = self.nodes[self.leader_index]
+            if leader.commit_index == leader.last_index() and all(
+                    node.last_applied == leader.commit_index for node in self.nodes if node.is_active()):
+                return True
+            await asyncio.sleep(self.heartbeat_interval)
+        return False
+
+    # --- Управление сетью (как в SMRNetwork) ---
+    def network_partition(self, partitioned_nodes: list):
+        for idx in partitioned_nodes:
+            self.nodes[idx].deactivate()
+            self.transport.partitioned.add(idx)
+
+    def recover_partitioned_node(self, node_idx: int):
+        self.nodes[node_idx].activate()
+        self.transport.partitioned.discard(node_idx)
+        # Лидер догонит узел при ближайшем такте
+        self.last_sent.pop(node_idx, None)
+
+    def change_leader(self):
+        """Новый срок: лидером становится активный узел с самым полным журналом"""
+        candidates = [node for node in self.nodes if node.is_active()]
+        if not candidates:
+            raise RuntimeError("Нет активных узлов")
+        new_leader = max(candidates, key=lambda node: (node.commit_index, node.last_index()))
+        self.nodes[self.leader_index].set_leader(False)
+        self.leader_index = new_leader.node_id
+        new_leader.set_leader(True)
+        self.term += 1
+        self.term_start = new_leader.commit_index
+        self.next_index = {}
+        self.match_index = {}
+        self.synced = set()
+        self.last_sent = {}
+        self.commit_sent = {}
+        self.acked_sent_at = {}
+        # Чтения, ждавшие подтверждения прежнего лидера, переходят к новому
+        for _, key, future in self.pending_reads:
+            self.transport.inboxes[self.leader_index].put_nowait(("read", key, "read_index", future, 0.0))
+        self.pending_reads = []
+        # Записи, которых у нового лидера нет, потеряны: клиент должен повторить
+        last_index = new_leader.last_index()
+        kept = deque()
+        for position, future in self.waiters:
+            if position <= last_index:
+                kept.append((position, future))
+            elif not future.done():
+                future.set_exception(ConnectionError("Запись потеряна при смене лидера"))
+        self.waiters = kept
+        self.transport.inboxes[self.leader_index].put_nowait(("tick",))
+
+    # --- Узлы ---
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self.transport.inboxes[self.leader_index].put_nowait(("tick",))
+
+    async def _run_node(self, node: Node, inbox: asyncio.Queue):
+        while True:
+            message = await inbox.get()
+            kind = message[0]
+            if kind == "append":
+                self._on_append(node, message)
+            elif kind == "read" and message[2] == "stale":
+                self._on_stale_read(node, message)
+            elif node.node_id != self.leader_index:
+                if kind in ("client", "read"):
+                    # Лидер сменился, пока запрос ждал в очереди
+                    self.transport.inboxes[self.leader_index].put_nowait(message)
+            elif kind == "client":
+                self._on_client(node, message[1], message[2])
+            elif kind == "read":
+                self._on_read(node, message)
+            elif kind == "ack":
+                self._on_ack(node, message)
+            elif kind == "tick":
+                self._on_tick(node)
+
+    def _on_append(self, node: Node, message: tuple):
+        _, term, seq, leader_id, prev_index, entries, leader_commit, snapshot, sent_at = message
+        if node.node_id == self.leader_index or (term, seq) <= self.received.get(node.node_id, (-1, 0)):
+            return  # запоздавшее сообщение прежнего лидера или повтор
+        self.received[node.node_id] = (term, seq)
+        self.heard_at[node.node_id] = time.monotonic()
+        if snapshot is not None and node.last_index() < prev_index:
+            node.install_snapshot(prev_index, snapshot)
+        ok, length = node.append_entries(prev_index, entries, leader_commit)
+        if len(node.log) >= self.snapshot_threshold:
+            node.take_snapshot()
+        self.transport.send(node.node_id, leader_id, ("ack", term, node.node_id, ok, length, sent_at))
+
+    def _on_stale_read(self, node: Node, message: tuple):
+        _, key, _, future, max_staleness = message
+        if future.done():
+            return
+        if node.node_id != self.leader_index and \
+                time.monotonic() - self.heard_at.get(node.node_id, float("-inf")) > max_staleness:
+            future.set_exception(RuntimeError(f"Узел {node.node_id} давно не получал вестей от лидера"))
+        else:
+            future.set_result(node.read(key))
+
+    def _on_read(self, leader: Node, message: tuple):
+        _, key, consistency, future, _ = message
+        if future.done():
+            return
+        if consistency == "lease" and time.monotonic() < self._lease_expiry():
+            future.set_result(leader.read(key))
+            return
+        # read_index: лидер применяет всё зафиксированное сразу, так что ждём
+        # только подтверждения лидерства большинством на раунде пульса
+        self.pending_reads.append((time.monotonic(), key, future))
+        for node in self.nodes:
+            if node is not leader:
+                self._send_append(leader, node.node_id)
+        self._serve_reads(leader)
+
+    def _lease_expiry(self) -> float:
+        """Аренда держится, пока большинство подтвердило сообщения не старше lease_duration"""
+        confirmed = sorted(
+            [time.monotonic()] + [self.acked_sent_at.get(n.node_id, float("-inf"))
+                                  for n in self.nodes if n.node_id != self.leader_index],
+            reverse=True
+        )
+        return confirmed[self.nodes_count // 2] + self.lease_duration
+
+    def _serve_reads(self, leader: Node):
+        if not self.pending_reads:
+            return
+        # Момент, до которого лидерство точно подтверждено большинством
+        confirmed_at = self._lease_expiry() - self.lease_duration
+        remaining = []
+        for started, key, future in self.pending_reads:
+            if future.done():
+                continue
+            if started <= confirmed_at:
+                future.set_result(leader.read(key))
+            else:
+                remaining.append((started, key, future))
+        self.pending_reads = remaining
+
+    def _on_client(self, leader: Node, commands: list, future: asyncio.Future):
+        leader.append_commands(commands)
+        self.waiters.append((leader.last_index(), future))
+        for node in self.nodes:
+            if node is not leader:
+                self._send_append(leader, node.node_id)
+        self._advance_commit(leader)
+
+    def _on_ack(self, leader: Node, message: tuple):
+        _, term, node_id, ok, length, sent_at = message
+        if term != self.term:
+            return
+        self.acked_sent_at[node_id] = max(self.acked_sent_at.get(node_id, float("-inf")), sent_at)
+        self._serve_reads(leader)
+        if ok:
+            self.synced.add(node_id)
+            self.match_index[node_id] = max(self.match_index.get(node_id, 0), length)
+            self._advance_commit(leader)
+        else:
+            self.next_index[node_id] = length
+            self._send_append(leader, node_id)
+
+    def _on_tick(self, leader: Node):
+        now = time.monotonic()
+        for node in self.nodes:
+            node_id = node.node_id
+            if node is leader:
+                continue
+            if self.match_index.get(node_id, 0) < leader.last_index():
+                if now - self.last_sent.get(node_id, 0.0) >= self.timeout:
+                    if node_id in self.synced:
+                        # Дешёвая проба: отставший узел ответит отказом и своей длиной
+                        self.next_index[node_id] = leader.last_index()
+                    self._send_append(leader, node_id)
+            elif self.commit_sent.get(node_id, 0) < leader.commit_index or \
+                    now - self.last_sent.get(node_id, 0.0) >= self.timeout:
+                # Пульс: сообщает commit_index и повторяется, если потерялся
+                self._send_append(leader, node_id)
+
+    def _send_append(self, leader: Node, node_id: int):
+        start = self.next_index.get(node_id, self.term_start)
+        if node_id not in self.synced:
+            # Хвост после term_start мог разойтись с нашим — шлём его целиком
+            start = min(start, self.term_start)
+        snapshot = None
+        if start < leader.snapshot_index:
+            start = leader.last_applied
+            snapshot = dict(leader.state)
+        self.seq[node_id] = seq = self.seq.get(node_id, 0) + 1
+        now = time.monotonic()
+        message = ("append", self.term, seq, leader.node_id, start, leader.entries_from(start),
+                   leader.commit_index, snapshot, now)
+        self.next_index[node_id] = leader.last_index()
+        self.last_sent[node_id] = now
+        self.commit_sent[node_id] = leader.commit_index
+        self.transport.send(leader.node_id, node_id, message)
+
+    def _advance_commit(self, leader: Node):
+        matches = sorted(
+            [leader.last_index()] + [self.match_index.get(n.node_id, 0) for n in self.nodes if n is not leader],
+            reverse=True
+        )
+        majority_index = matches[self.nodes_count // 2]
+        if majority_index <= leader.commit_index:
+            return
+        leader.advance_commit(majority_index)
+        if len(leader.log) >= self.snapshot_threshold:
+            leader.take_snapshot()
+        while self.waiters and self.waiters[0][0] <= leader.commit_index:
+            _, future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(leader.commit_index)
+
+
 # ==============================
 # Графический интерфейс (GUI)
 # ==============================
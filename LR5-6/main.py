@@ -1,27 +1,46 @@
+import argparse
+import array
+import bisect
+import functools
+import itertools
+import json
+import math
+import os
 import random
+import statistics
 import time
+from collections import deque
+from contextlib import redirect_stdout
+from multiprocessing import Pool
 from tkinter import *
 from tkinter import scrolledtext, messagebox
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 # ==============================
 # Узел (валидатор)
 # ==============================
 class Validator:
-    def __init__(self, name: str, balance: float):
+    def __init__(self, name: str, balance: float, block_penalty: float = 5.0):
         self.name = name
         self.balance = balance  # текущий баланс
+        self.block_penalty = block_penalty  # на сколько падает вес за каждый созданный блок
         self.deposit = 0.0      # сумма депозита
         self.blocks_created = 0
         self.slashed = False
+        self.on_weight_change = None  # вызывается после изменения веса (индекс выбора)
+
+    def _weight_changed(self):
+        if self.on_weight_change:
+            self.on_weight_change()
 
     def get_weight(self):
         """Возвращает вес для выбора валидатора"""
         if self.slashed:
             return 0
-        penalty = self.blocks_created * 5
+        penalty = self.blocks_created * self.block_penalty
         weight = max(1, self.deposit + self.balance - penalty)
         return weight
 
@@ -30,6 +49,7 @@ class Validator:
             return False
         self.balance -= amount
         self.deposit += amount
+        self._weight_changed()
         print(f"[Validator {self.name}] Депозит увеличен на {amount:.2f}")
         return True
 
@@ -39,6 +59,7 @@ class Validator:
         self.blocks_created += 1
         reward = 1.0
         self.balance += reward
+        self._weight_changed()
         print(f"[Validator {self.name}] Создан блок | Баланс: {self.balance}, Блоков: {self.blocks_created}")
         return {
             "validator": self.name,
@@ -53,29 +74,609 @@ class Validator:
         self.deposit -= actual_penalty
         self.balance += actual_penalty * 0.5
         self.slashed = True
+        self._weight_changed()
         print(f"[Validator {self.name}] Слэш: -{actual_penalty} из депозита")
 
 
+# ==============================
+# Компактный реестр валидаторов (struct-of-arrays)
+# ==============================
+class ValidatorRegistry:
+    """Валидаторы в колонках NumPy, индексированных номером валидатора.
+
+    Вместо объекта на валидатора — по элементу в каждой колонке. registry[i]
+    отдаёт лёгкое представление ValidatorView с интерфейсом Validator,
+    поэтому BlockchainPoS принимает реестр вместо списка без изменений.
+    Имена хранятся в UTF-8 не длиннее name_length байт; более длинные
+    отклоняются, а не обрезаются, чтобы разные валидаторы не слились.
+    """
+
+    def __init__(self, capacity: int = 1024, block_penalty: float = 5.0, name_length: int = 16):
+        self.size = 0
+        self.block_penalty = block_penalty
+        self.names = np.zeros(capacity, dtype=f"S{name_length}")
+        self.balance = np.zeros(capacity, dtype=np.float64)
+        self.deposit = np.zeros(capacity, dtype=np.float64)
+        self.blocks_created = np.zeros(capacity, dtype=np.uint32)
+        self.slashed = np.zeros(capacity, dtype=np.bool_)
+        self.on_weight_change = None  # вызывается с номером валидатора, чей вес изменился
+
+    def _reserve(self, size: int):
+        capacity = len(self.balance)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for column in ("names", "balance", "deposit", "blocks_created", "slashed"):
+            old = getattr(self, column)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    def add(self, name: str, balance: float) -> int:
+        return self.add_many([name], [balance])
+
+    def add_many(self, names, balances) -> int:
+        """Добавляет валидаторов пачкой; возвращает номер первого"""
+        encoded = [name.encode() for name in names]
+        limit = self.names.dtype.itemsize
+        for name, data in zip(names, encoded):
+            if len(data) > limit:
+                raise ValueError(f"Имя валидатора {name!r} длиннее {limit} байт UTF-8 (увеличьте name_length)")
+        start = self.size
+        self._reserve(start + len(names))
+        self.names[start:start + len(names)] = encoded
+        self.balance[start:start + len(names)] = balances
+        self.size += len(names)
+        return start
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position: int):
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        return ValidatorView(self, position)
+
+    def __iter__(self):
+        return (ValidatorView(self, i) for i in range(self.size))
+
+    def name(self, position: int) -> str:
+        return self.names[position].decode()
+
+    def get_weight(self, position: int):
+        if self.slashed[position]:
+            return 0
+        return max(1, float(self.deposit[position] + self.balance[position]
+                            - int(self.blocks_created[position]) * self.block_penalty))
+
+    def weights(self) -> np.ndarray:
+        """Веса всех валидаторов одной векторной операцией"""
+        n = self.size
+        raw = self.deposit[:n] + self.balance[:n] - self.blocks_created[:n] * self.block_penalty
+        return np.where(self.slashed[:n], 0.0, np.maximum(1.0, raw))
+
+    def _weight_changed(self, position: int):
+        if self.on_weight_change:
+            self.on_weight_change(position)
+
+    # Те же изменения и сообщения, что у методов Validator
+    def deposit_stake(self, position: int, amount: float):
+        if amount <= 0 or self.slashed[position]:
+            return False
+        self.balance[position] -= amount
+        self.deposit[position] += amount
+        self._weight_changed(position)
+        print(f"[Validator {self.name(position)}] Депозит увеличен на {amount:.2f}")
+        return True
+
+    def create_block(self, position: int):
+        if self.slashed[position]:
+            raise RuntimeError("Слэшированный узел не может создавать блоки")
+        self.blocks_created[position] += 1
+        self.balance[position] += 1.0
+        self._weight_changed(position)
+        balance = float(self.balance[position])
+        blocks = int(self.blocks_created[position])
+        print(f"[Validator {self.name(position)}] Создан блок | Баланс: {balance}, Блоков: {blocks}")
+        return {
+            "validator": self.name(position),
+            "validator_id": position,
+            "blocks_created": blocks,
+            "balance": balance,
+            "timestamp": time.time()
+        }
+
+    def slash(self, position: int, penalty: float):
+        actual_penalty = min(penalty, float(self.deposit[position]))
+        self.deposit[position] -= actual_penalty
+        self.balance[position] += actual_penalty * 0.5
+        self.slashed[position] = True
+        self._weight_changed(position)
+        print(f"[Validator {self.name(position)}] Слэш: -{actual_penalty} из депозита")
+
+    def stats(self) -> dict:
+        """Колонки статистики целиком, для векторных расчётов"""
+        n = self.size
+        return {
+            "name": self.names[:n],
+            "weight": self.weights(),
+            "blocks": self.blocks_created[:n],
+            "balance": self.balance[:n],
+            "deposit": self.deposit[:n],
+            "slashed": self.slashed[:n],
+        }
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, c).nbytes for c in ("names", "balance", "deposit", "blocks_created", "slashed"))
+
+
+class ValidatorView:
+    """Валидатор реестра с интерфейсом Validator; своих данных не хранит"""
+
+    def __init__(self, registry: ValidatorRegistry, position: int):
+        self.registry = registry
+        self.position = position
+
+    @property
+    def name(self):
+        return self.registry.name(self.position)
+
+    @property
+    def balance(self):
+        return float(self.registry.balance[self.position])
+
+    @property
+    def deposit(self):
+        return float(self.registry.deposit[self.position])
+
+    @property
+    def blocks_created(self):
+        return int(self.registry.blocks_created[self.position])
+
+    @property
+    def slashed(self):
+        return bool(self.registry.slashed[self.position])
+
+    def get_weight(self):
+        return self.registry.get_weight(self.position)
+
+    def deposit_stake(self, amount: float):
+        return self.registry.deposit_stake(self.position, amount)
+
+    def create_block(self):
+        return self.registry.create_block(self.position)
+
+    def slash(self, penalty: float):
+        self.registry.slash(self.position, penalty)
+
+
+class BlockLog:
+    """Цепочка блоков в колонках: автор, его счётчик блоков, баланс, время, эпоха.
+
+    Около 30 байт на блок вместо словаря; блок в прежнем виде словаря
+    собирается только при обращении.
+    """
+
+    def __init__(self, registry: ValidatorRegistry, capacity: int = 1024):
+        self.registry = registry
+        self.size = 0
+        self.validator = np.zeros(capacity, dtype=np.int32)
+        self.blocks_created = np.zeros(capacity, dtype=np.uint32)
+        self.balance = np.zeros(capacity, dtype=np.float64)
+        self.timestamp = np.zeros(capacity, dtype=np.float64)
+        self.epoch = np.full(capacity, -1, dtype=np.int32)
+
+    def append(self, block: dict):
+        if self.size == len(self.validator):
+            for column in ("validator", "blocks_created", "balance", "timestamp", "epoch"):
+                old = getattr(self, column)
+                new = np.full(len(old) * 2, -1 if column == "epoch" else 0, dtype=old.dtype)
+                new[:self.size] = old
+                setattr(self, column, new)
+        i = self.size
+        self.validator[i] = block["validator_id"]
+        self.blocks_created[i] = block["blocks_created"]
+        self.balance[i] = block["balance"]
+        self.timestamp[i] = block["timestamp"]
+        self.size += 1
+        # Эпоху add_block дописывает в словарь уже после добавления в цепочку
+        if "epoch" in block:
+            self.epoch[i] = block["epoch"]
+
+    def set_epoch(self, i: int, epoch: int):
+        self.epoch[i] = epoch
+
+    def __len__(self):
+        return self.size
+
+    def _block(self, i: int) -> dict:
+        block = {
+            "validator": self.registry.name(int(self.validator[i])),
+            "validator_id": int(self.validator[i]),
+            "blocks_created": int(self.blocks_created[i]),
+            "balance": float(self.balance[i]),
+            "timestamp": float(self.timestamp[i])
+        }
+        if self.epoch[i] >= 0:
+            block["epoch"] = int(self.epoch[i])
+        return block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._block(i) for i in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return self._block(index)
+
+    def __iter__(self):
+        return (self._block(i) for i in range(self.size))
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, c).nbytes for c in ("validator", "blocks_created", "balance", "timestamp", "epoch"))
+
+
+# ==============================
+# Индекс взвешенного выбора валидатора
+# ==============================
+class WeightIndex:
+    """Дерево Фенвика над весами валидаторов.
+
+    Выбор — поиск первого валидатора, чья накопленная сумма весов достигает
+    случайного порога, как в линейном проходе, но за O(log n). Изменение
+    веса одного валидатора обновляет дерево тоже за O(log n).
+    Накопленная погрешность сумм float сбрасывается полной перестройкой
+    раз в n обновлений.
+    """
+
+    def __init__(self, validators: list):
+        self.validators = validators
+        self.rebuild()
+
+    def rebuild(self):
+        n = len(self.validators)
+        # array('d') вдвое-вчетверо компактнее списка float при том же доступе
+        if isinstance(self.validators, ValidatorRegistry):
+            self.weights = array.array('d', self.validators.weights().tobytes())
+        else:
+            self.weights = array.array('d', (float(v.get_weight()) for v in self.validators))
+        self.tree = array.array('d', bytes(8 * (n + 1)))
+        for i, weight in enumerate(self.weights, start=1):
+            self.tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= n:
+                self.tree[parent] += self.tree[i]
+        self.top = 1 << (n.bit_length() - 1) if n else 0
+        self.total = self._prefix(n)
+        self.updates = 0
+
+    def _prefix(self, i: int) -> float:
+        result = 0.0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def update(self, position: int):
+        """Пересчитывает вес валидатора с номером position"""
+        weight = float(self.validators[position].get_weight())
+        delta = weight - self.weights[position]
+        if delta == 0:
+            return
+        self.weights[position] = weight
+        n = len(self.weights)
+        i = position + 1
+        while i <= n:
+            self.tree[i] += delta
+            i += i & -i
+        self.updates += 1
+        if self.updates > n:
+            self.rebuild()
+        else:
+            self.total = self._prefix(n)
+
+    def find(self, threshold: float) -> int:
+        """Номер первого валидатора с накопленной суммой весов >= threshold"""
+        position = 0
+        step = self.top
+        while step:
+            nxt = position + step
+            if nxt < len(self.tree) and self.tree[nxt] < threshold:
+                position = nxt
+                threshold -= self.tree[nxt]
+            step >>= 1
+        return min(position, len(self.weights) - 1)
+
+    def select(self):
+        if self.total <= 0:
+            raise RuntimeError("Нет активных валидаторов")
+        threshold = random.uniform(0, self.total)
+        # Порог 0 в линейном проходе достаётся первому неслэшированному
+        return self.validators[self.find(threshold if threshold > 0 else 5e-324)]
+
+
+# ==============================
+# Снимки валидаторов по эпохам
+# ==============================
+class EpochSnapshot:
+    """Неизменяемый срез набора валидаторов и их весов на границе эпохи.
+
+    Внутри эпохи выбор идёт по замороженным весам (бинарный поиск по
+    накопленным суммам), а изменения ставок вступают в силу пачкой
+    со следующим снимком.
+    """
+
+    def __init__(self, epoch: int, start_height: int, validators: list):
+        self.epoch = epoch
+        self.start_height = start_height
+        self.names = tuple(v.name for v in validators)
+        self.weights = tuple(float(v.get_weight()) for v in validators)
+        self.balances = tuple(v.balance for v in validators)
+        self.deposits = tuple(v.deposit for v in validators)
+        self.blocks = tuple(v.blocks_created for v in validators)
+        self.slashed = tuple(v.slashed for v in validators)
+        self.cumulative = tuple(itertools.accumulate(self.weights))
+        self.total = self.cumulative[-1] if self.cumulative else 0.0
+        self._stats = None
+
+    def select_index(self) -> int:
+        """Тот же розыгрыш порога, что и в select_validator, но по снимку"""
+        threshold = random.uniform(0, self.total)
+        index = bisect.bisect_left(self.cumulative, threshold if threshold > 0 else 5e-324)
+        return min(index, len(self.cumulative) - 1)
+
+    def stats(self) -> dict:
+        """Статистика в формате get_validator_stats; считается один раз на эпоху"""
+        if self._stats is None:
+            self._stats = {
+                name: {
+                    "weight": weight,
+                    "blocks": blocks,
+                    "balance": balance,
+                    "deposit": deposit,
+                    "slashed": slashed
+                } for name, weight, blocks, balance, deposit, slashed in zip(
+                    self.names, self.weights, self.blocks, self.balances, self.deposits, self.slashed
+                )
+            }
+        return self._stats
+
+
+# ==============================
+# Потоковый детектор долгосрочных атак
+# ==============================
+class RingWindow:
+    """Последние size авторов блоков и доли веса, с которыми каждый их получил.
+
+    Блоки одного валидатора покидают окно в том же порядке, в каком вошли,
+    поэтому его доли хранятся в очереди: длина — число блоков в окне,
+    голова — доля на момент самого старого из них.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buffer = [-1] * size
+        self.position = 0
+        self.filled = 0
+        self.shares = {}
+
+    def push(self, validator_id: int, share: float) -> tuple:
+        """Сдвигает окно на один блок; возвращает (блоков автора в окне,
+        его доля на момент самого старого из них)"""
+        evicted = self.buffer[self.position]
+        if evicted >= 0:
+            queue = self.shares[evicted]
+            queue.popleft()
+            if not queue:
+                del self.shares[evicted]
+        else:
+            self.filled += 1
+        self.buffer[self.position] = validator_id
+        self.position = (self.position + 1) % self.size
+        queue = self.shares.get(validator_id)
+        if queue is None:
+            queue = self.shares[validator_id] = deque()
+        queue.append(share)
+        return len(queue), queue[0]
+
+
+class LongRangeDetector:
+    """Серии подряд и перекос долей блоков относительно веса.
+
+    На каждый блок в каждом окне меняются два счётчика, и проверяется
+    только автор нового блока: O(1) на блок при любом размере окон.
+    Валидатор помечается, если вероятность получить столько блоков при его
+    доле веса ниже alert_probability. Доля берётся наибольшая из текущей и
+    той, что была у самого старого его блока в окне: вес падает с каждым блоком.
+    Вероятность оценивается сверху границей Чернова exp(-n·KL(count/n || доля)),
+    верной и для малых ожидаемых чисел блоков.
+    """
+
+    def __init__(self, windows=(100, 1000, 10000), alert_probability: float = 1e-6, min_blocks: int = 50):
+        self.windows = [RingWindow(size) for size in windows]
+        self.score_threshold = -math.log(alert_probability)
+        self.min_blocks = min_blocks
+        self.streak_owner = None
+        self.streak = 0
+        self.flagged = set()  # (размер окна, валидатор), о которых уже предупредили
+
+    def observe(self, validator_id: int, share: float) -> tuple:
+        """Учитывает блок автора с ожидаемой долей share.
+        Возвращает (длина его серии подряд, новые предупреждения)."""
+        if validator_id == self.streak_owner:
+            self.streak += 1
+        else:
+            self.streak_owner = validator_id
+            self.streak = 1
+        alerts = []
+        for window in self.windows:
+            count, oldest_share = window.push(validator_id, share)
+            n = window.filled
+            baseline = max(share, oldest_share)
+            if n < self.min_blocks or not 0 < baseline < 1:
+                continue
+            score = n * _kl_divergence(count / n, baseline) if count > n * baseline else 0.0
+            key = (window.size, validator_id)
+            if score > self.score_threshold:
+                if key not in self.flagged:
+                    self.flagged.add(key)
+                    alerts.append({"window": window.size, "validator": validator_id, "count": count,
+                                   "expected": n * baseline, "probability": math.exp(-score)})
+            elif key in self.flagged:
+                self.flagged.discard(key)
+        return self.streak, alerts
+
+
+def _kl_divergence(q: float, p: float) -> float:
+    """KL(Bernoulli(q) || Bernoulli(p)) для q > p"""
+    result = q * math.log(q / p)
+    if q < 1:
+        result += (1 - q) * math.log((1 - q) / (1 - p))
+    return result
+
+
+# ==============================
+# Векторизованная симуляция атаки (Монте-Карло)
+# ==============================
+class AttackSimulator:
+    """Симуляция выбора валидаторов пачками на NumPy.
+
+    Кумулятивные веса считаются один раз; раунд — это случайный порог в
+    [0, сумма весов), а выбранный валидатор — первый, чья накопленная сумма
+    его достигает (searchsorted). Слэшированные валидаторы в массив не
+    попадают, как и в select_validator.
+    """
+
+    def __init__(self, validators: list, max_draws_per_chunk: int = 1 << 22, weights: list = None):
+        """weights — веса вместо текущих get_weight() (например, из снимка эпохи)"""
+        if isinstance(validators, ValidatorRegistry):
+            n = len(validators)
+            weights = validators.weights() if weights is None else np.asarray(weights, dtype=np.float64)
+            active = ~validators.slashed[:n]
+            self.names = [name.decode() for name in validators.names[:n][active].tolist()]
+            self.cumulative = np.cumsum(weights[active])
+        else:
+            if weights is None:
+                weights = [v.get_weight() for v in validators]
+            active = [(v, w) for v, w in zip(validators, weights) if not v.slashed]
+            self.names = [v.name for v, _ in active]
+            self.cumulative = np.cumsum(np.array([w for _, w in active], dtype=np.float64))
+        if not len(self.cumulative) or self.cumulative[-1] <= 0:
+            raise RuntimeError("Нет активных валидаторов")
+        self.max_draws_per_chunk = max_draws_per_chunk
+
+    def select(self, rng: np.random.Generator, shape) -> np.ndarray:
+        """Индексы выбранных валидаторов для массива раундов формы shape"""
+        thresholds = rng.random(shape) * self.cumulative[-1]
+        return np.searchsorted(self.cumulative, thresholds, side='left')
+
+    def attacker_counts(self, attacker_name: str, rounds: int, trials: int = 1, seed=None) -> np.ndarray:
+        """Сколько блоков получил злоумышленник в каждом из trials испытаний"""
+        if seed is None:
+            seed = random.getrandbits(64)  # воспроизводимо через random.seed, как раньше
+        rng = np.random.default_rng(seed)
+        counts = np.zeros(trials, dtype=np.int64)
+        if attacker_name not in self.names:
+            return counts
+        attacker = self.names.index(attacker_name)
+        rows = max(1, self.max_draws_per_chunk // max(1, rounds))
+        for start in range(0, trials, rows):
+            stop = min(trials, start + rows)
+            # Длинные испытания режутся по раундам, чтобы не выделять гигабайты
+            for round_start in range(0, rounds, self.max_draws_per_chunk):
+                width = min(rounds - round_start, self.max_draws_per_chunk)
+                counts[start:stop] += np.count_nonzero(self.select(rng, (stop - start, width)) == attacker, axis=1)
+        return counts
+
+    def run(self, attacker_name: str, rounds: int, trials: int = 1000, confidence: float = 0.95, seed=None) -> dict:
+        """Доля блоков злоумышленника по trials испытаниям с доверительным интервалом"""
+        counts = self.attacker_counts(attacker_name, rounds, trials, seed)
+        shares = counts / rounds
+        mean = float(shares.mean())
+        if trials > 1:
+            spread = float(shares.std(ddof=1)) / trials ** 0.5
+        else:
+            spread = (mean * (1 - mean) / rounds) ** 0.5
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        return {
+            "attacker": attacker_name,
+            "rounds": rounds,
+            "trials": trials,
+            "share": mean,
+            "ci_low": max(0.0, mean - z * spread),
+            "ci_high": min(1.0, mean + z * spread),
+            "confidence": confidence,
+            "majority_probability": float(np.mean(counts * 2 > rounds)),
+            "expected_share": self.expected_share(attacker_name),
+        }
+
+    def expected_share(self, attacker_name: str) -> float:
+        if attacker_name not in self.names:
+            return 0.0
+        i = self.names.index(attacker_name)
+        weight = self.cumulative[i] - (self.cumulative[i - 1] if i else 0.0)
+        return float(weight / self.cumulative[-1])
+
+
 # ==============================
 # Блокчейн с PoS, слэшингом и защитой от долгосрочных атак
 # ==============================
 class BlockchainPoS:
-    def __init__(self, validators: list):
+    def __init__(self, validators: list, epoch_length: int = None, detector_windows=(100, 1000, 10000),
+                 slash_fraction: float = 0.75):
+        """epoch_length — число блоков в эпохе; None — веса читаются вживую.
+        slash_fraction — доля депозита, которую забирает слэш за серию блоков."""
         self.validators = validators
-        self.chain = []
+        self.slash_fraction = slash_fraction
+        # С реестром и цепочка хранится в колонках, а номер валидатора известен без словаря имён
+        self.registry = validators if isinstance(validators, ValidatorRegistry) else None
+        self.chain = BlockLog(validators) if self.registry else []
+        self.positions = None if self.registry else {v.name: i for i, v in enumerate(validators)}
+        self.detector = LongRangeDetector(detector_windows)
+        self.attack_alerts = deque(maxlen=1000)
+        self.epoch_length = epoch_length
+        self.epochs: list[EpochSnapshot] = []
+        self.weight_index = None
+        if epoch_length:
+            self.epochs.append(EpochSnapshot(0, 0, validators))
+        else:
+            # Веса меняют только методы Validator, и каждый сообщает об этом индексу
+            self.weight_index = WeightIndex(validators)
+            if self.registry:
+                self.registry.on_weight_change = self.weight_index.update
+            else:
+                for position, validator in enumerate(validators):
+                    validator.on_weight_change = functools.partial(self.weight_index.update, position)
+
+    @property
+    def current_epoch(self):
+        return self.epochs[-1] if self.epochs else None
 
     def select_validator(self):
-        weights = [(v, v.get_weight()) for v in self.validators]
-        total_weight = sum(w[1] for w in weights)
-        if total_weight == 0:
+        if not self.epoch_length:
+            return self.weight_index.select()
+        snapshot = self.epochs[-1]
+        if snapshot.total <= 0:
+            raise RuntimeError("Нет активных валидаторов")
+        # Слэш действует сразу, не дожидаясь эпохи: такой выбор разыгрывается заново
+        for _ in range(64):
+            validator = self.validators[snapshot.select_index()]
+            if not validator.slashed:
+                return validator
+        active = [(v, w) for v, w in zip(self.validators, snapshot.weights) if not v.slashed and w > 0]
+        if not active:
             raise RuntimeError("Нет активных валидаторов")
-        threshold = random.uniform(0, total_weight)
+        threshold = random.uniform(0, sum(w for _, w in active))
         current_sum = 0
-        for validator, weight in weights:
+        for validator, weight in active:
             current_sum += weight
-            if current_sum >= threshold and not validator.slashed:
+            if current_sum >= threshold:
                 return validator
-        return None
+        return active[-1][0]
 
     def add_block(self):
         selected = self.select_validator()
@@ -83,29 +684,42 @@ class BlockchainPoS:
             block = selected.create_block()
             self.chain.append(block)
             self.check_long_range_attack(selected)
+            if self.epoch_length:
+                block["epoch"] = self.epochs[-1].epoch
+                if self.registry:
+                    self.chain.set_epoch(len(self.chain) - 1, block["epoch"])
+                if len(self.chain) - self.epochs[-1].start_height >= self.epoch_length:
+                    self.epochs.append(EpochSnapshot(len(self.epochs), len(self.chain), self.validators))
             return block
         else:
             raise RuntimeError("Не выбран валидатор")
 
     def check_long_range_attack(self, latest_validator):
-        """Обнаруживает долгосрочные атаки"""
-        if len(self.chain) < 3:
-            return
-        recent_blocks = self.chain[-3:]
-        names = [b["validator"] for b in recent_blocks]
-        if all(name == latest_validator.name for name in names):
+        """Обнаруживает долгосрочные атаки: 3 блока подряд или перекос доли в окнах"""
+        position = latest_validator.position if self.registry else self.positions[latest_validator.name]
+        streak, alerts = self.detector.observe(position, self._expected_share(position))
+        for alert in alerts:
+            alert["validator"] = latest_validator.name
+            self.attack_alerts.append(alert)
+            print(f"[Предупреждение] {latest_validator.name}: {alert['count']} из последних "
+                  f"{alert['window']} блоков при ожидаемых {alert['expected']:.1f} "
+                  f"(вероятность < {alert['probability']:.1e})")
+        if streak >= 3:
             print(f"[Предупреждение] Обнаруженная долгосрочная атака от {latest_validator.name}")
-            latest_validator.slash(latest_validator.deposit * 0.75)
+            latest_validator.slash(latest_validator.deposit * self.slash_fraction)
+
+    def _expected_share(self, position: int) -> float:
+        """Доля веса валидатора в выборе, по которой он получает блоки"""
+        if self.epoch_length:
+            snapshot = self.epochs[-1]
+            return snapshot.weights[position] / snapshot.total if snapshot.total else 0.0
+        index = self.weight_index
+        return index.weights[position] / index.total if index.total else 0.0
 
     def simulate_attack(self, attacker_name: str, rounds=100):
-        attack_blocks = 0
-        honest_blocks = 0
-        for _ in range(rounds):
-            selected = self.select_validator()
-            if selected.name == attacker_name:
-                attack_blocks += 1
-            else:
-                honest_blocks += 1
+        # Выбор не меняет состояние, поэтому все раунды разыгрываются одной пачкой
+        attack_blocks = int(self._attack_simulator().attacker_counts(attacker_name, rounds)[0])
+        honest_blocks = rounds - attack_blocks
         print(f"\n[+] === Результаты симуляции атаки ===")
         print(f"[+] Злоумышленник: {attack_blocks} из {rounds} ({attack_blocks / rounds * 100:.2f}%)")
         print(f"[+] Честные узлы: {honest_blocks} из {rounds} ({honest_blocks / rounds * 100:.2f}%)")
@@ -115,7 +729,32 @@ class BlockchainPoS:
             print("[+] ✅ Сеть стабильна.")
         return attack_blocks, honest_blocks
 
-    def get_validator_stats(self):
+    def simulate_attack_mc(self, attacker_name: str, rounds=100, trials=1000, confidence=0.95, seed=None):
+        """Много независимых симуляций атаки сразу; доля злоумышленника с интервалом"""
+        return self._attack_simulator().run(attacker_name, rounds, trials, confidence, seed)
+
+    def _attack_simulator(self):
+        weights = self.epochs[-1].weights if self.epoch_length else None
+        return AttackSimulator(self.validators, weights=weights)
+
+    def get_validator_stats(self, epoch: int = None):
+        """В режиме эпох отдаёт готовую статистику снимка (текущего или epoch)"""
+        if self.epoch_length:
+            return self.epochs[-1 if epoch is None else epoch].stats()
+        if self.registry:
+            columns = self.registry.stats()
+            return {
+                name.decode(): {
+                    "weight": weight,
+                    "blocks": blocks,
+                    "balance": balance,
+                    "deposit": deposit,
+                    "slashed": slashed
+                } for name, weight, blocks, balance, deposit, slashed in zip(
+                    columns["name"].tolist(), columns["weight"].tolist(), columns["blocks"].tolist(),
+                    columns["balance"].tolist(), columns["deposit"].tolist(), columns["slashed"].tolist()
+                )
+            }
         stats = {
             v.name: {
                 "weight": v.get_weight(),
@@ -128,6 +767,129 @@ class BlockchainPoS:
         return stats
 
 
+# ==============================
+# Перебор параметров атаки в пуле процессов
+# ==============================
+# Колонки результата: имя и тип NumPy; каждая пишется в свой файл <имя>.bin
+SWEEP_COLUMNS = [
+    ("cell", "<i8"),
+    ("seed", "<i8"),
+    ("attacker_stake", "<f8"),
+    ("honest_validators", "<i8"),
+    ("block_penalty", "<f8"),
+    ("slash_fraction", "<f8"),
+    ("rounds", "<i8"),
+    ("blocks", "<i8"),
+    ("attacker_blocks", "<i8"),
+    ("attacker_share", "<f8"),
+    ("expected_share", "<f8"),
+    ("attacker_slashed", "<u1"),
+    ("alerts", "<i8"),
+    ("seconds", "<f8"),
+]
+
+
+class ColumnarWriter:
+    """Дописывает строки результатов поколоночно, по мере поступления.
+
+    Каталог содержит файл на колонку и schema.json с типами и числом строк,
+    который обновляется при закрытии.
+    """
+
+    def __init__(self, directory: str, columns=SWEEP_COLUMNS, buffer_rows: int = 256):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.columns = columns
+        self.buffer_rows = buffer_rows
+        self.pending = {name: [] for name, _ in columns}
+        self.files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name, _ in columns}
+        self.rows = 0
+
+    def append(self, row: dict):
+        for name, _ in self.columns:
+            self.pending[name].append(row[name])
+        self.rows += 1
+        if len(self.pending[self.columns[0][0]]) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        for name, dtype in self.columns:
+            if self.pending[name]:
+                self.files[name].write(np.asarray(self.pending[name], dtype=dtype).tobytes())
+                self.pending[name] = []
+            self.files[name].flush()
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.directory, "schema.json"), "w") as f:
+            json.dump({"rows": self.rows, "columns": self.columns}, f, indent=4)
+
+
+def load_sweep(directory: str) -> dict:
+    """Колонки результата перебора как массивы NumPy"""
+    with open(os.path.join(directory, "schema.json")) as f:
+        schema = json.load(f)
+    return {
+        name: np.fromfile(os.path.join(directory, f"{name}.bin"), dtype=dtype)[:schema["rows"]]
+        for name, dtype in schema["columns"]
+    }
+
+
+def _run_sweep_cell(params: dict) -> dict:
+    """Одна клетка сетки: реальная выработка блоков со слэшингом и детектором"""
+    started = time.perf_counter()
+    random.seed(params["seed"])
+    validators = [Validator(f"Node{i}", 100.0, params["block_penalty"]) for i in range(params["honest_validators"])]
+    attacker = Validator("Attacker", 100.0 * params["attacker_stake"], params["block_penalty"])
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for v in validators + [attacker]:
+            v.deposit_stake(50.0)
+        blockchain = BlockchainPoS(validators + [attacker], slash_fraction=params["slash_fraction"])
+        expected_share = blockchain._expected_share(len(validators))
+        for _ in range(params["rounds"]):
+            try:
+                blockchain.add_block()
+            except RuntimeError:
+                break  # слэшированы все
+    return {
+        **params,
+        "blocks": len(blockchain.chain),
+        "attacker_blocks": attacker.blocks_created,
+        "attacker_share": attacker.blocks_created / len(blockchain.chain) if blockchain.chain else 0.0,
+        "expected_share": expected_share,
+        "attacker_slashed": attacker.slashed,
+        "alerts": sum(alert["validator"] == "Attacker" for alert in blockchain.attack_alerts),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def run_parameter_sweep(directory: str, attacker_stakes, honest_counts, block_penalties=(5.0,),
+                        slash_fractions=(0.75,), rounds=(1000,), seed: int = 0, processes: int = None) -> int:
+    """Прогоняет все клетки сетки в пуле процессов и пишет результаты в directory.
+
+    attacker_stakes — баланс злоумышленника в долях баланса честного узла.
+    Каждая клетка получает свой seed, выведенный из seed и её номера,
+    поэтому результат не зависит от числа процессов и порядка выполнения.
+    Возвращает число клеток.
+    """
+    grid = itertools.product(attacker_stakes, honest_counts, block_penalties, slash_fractions, rounds)
+    cells = [
+        {"cell": i, "seed": seed * 1_000_003 + i, "attacker_stake": stake, "honest_validators": honest,
+         "block_penalty": penalty, "slash_fraction": fraction, "rounds": cell_rounds}
+        for i, (stake, honest, penalty, fraction, cell_rounds) in enumerate(grid)
+    ]
+    writer = ColumnarWriter(directory)
+    try:
+        with Pool(processes) as pool:
+            for row in pool.imap_unordered(_run_sweep_cell, cells):
+                writer.append(row)
+    finally:
+        writer.close()
+    return len(cells)
+
+
 # ==============================
 # Графический интерфейс (GUI)
 # ==============================
@@ -196,6 +958,7 @@ class PoSGUI:
         attacker_name = self.attack_validator.get()
         rounds = int(self.attack_rounds.get())
         attack_blocks, honest_blocks = self.blockchain.simulate_attack(attacker_name, rounds)
+        self.last_attack = (attacker_name, rounds, attack_blocks, honest_blocks)
         self.update_display()
 
     def plot_weights(self):
@@ -215,7 +978,12 @@ class PoSGUI:
     def plot_attack_results(self):
         attacker_name = self.attack_validator.get()
         rounds = int(self.attack_rounds.get())
-        attack_blocks, honest_blocks = self.blockchain.simulate_attack(attacker_name, rounds)
+        # График строится по уже проведённой симуляции с теми же параметрами
+        last = getattr(self, "last_attack", None)
+        if last and last[:2] == (attacker_name, rounds):
+            attack_blocks, honest_blocks = last[2:]
+        else:
+            attack_blocks, honest_blocks = self.blockchain.simulate_attack(attacker_name, rounds)
 
         labels = ['Злоумышленник', 'Честные']
         counts = [attack_blocks, honest_blocks]
@@ -232,6 +1000,25 @@ class PoSGUI:
 # Точка входа
 # ==============================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PoS блокчейн: GUI или пакетный перебор параметров атаки")
+    parser.add_argument("--sweep", metavar="DIR", help="без GUI: перебрать сетку параметров и записать в DIR")
+    parser.add_argument("--stakes", type=float, nargs="+", default=[1.0, 2.0, 3.0, 5.0],
+                        help="баланс злоумышленника в долях честного")
+    parser.add_argument("--honest", type=int, nargs="+", default=[5, 10, 50])
+    parser.add_argument("--penalties", type=float, nargs="+", default=[5.0], help="снижение веса за блок")
+    parser.add_argument("--slash", type=float, nargs="+", default=[0.75], help="доля депозита при слэше")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.sweep:
+        started = time.perf_counter()
+        cells = run_parameter_sweep(args.sweep, args.stakes, args.honest, args.penalties, args.slash,
+                                    args.rounds, args.seed, args.processes)
+        print(f"[Перебор] {cells} клеток за {time.perf_counter() - started:.1f} с, результаты в {args.sweep}")
+        raise SystemExit
+
     # Инициализация валидаторов
     honest_validators = [Validator(f"Node{i}", balance=100.0) for i in range(5)]
     attacker = Validator("Attacker", balance=300.0)
@@ -0,0 +1,251 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# ==============================
+# Загрузка модулей лабораторных
+# ==============================
+def load_lab(directory: str, module_name: str):
+    """Каждая лабораторная — отдельный main.py, поэтому грузим их под разными именами"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    path = os.path.join(ROOT, directory, "main.py")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ==============================
+# Синтетические нагрузки
+# ==============================
+# Нагрузка — функция (args) -> (setup, op): setup создаёт свежее состояние,
+# op(state, i) выполняет одну операцию, время которой и измеряется.
+def pow_create_block(args):
+    lab = load_lab("LR1-2", "lab_pow")
+
+    def setup():
+        return lab.Blockchain(difficulty=args.pow_difficulty)
+
+    def op(blockchain, i):
+        for j in range(args.pow_transactions):
+            blockchain.new_transaction(lab.Transaction(f"sender{j}", f"recipient{i}", 1.0, nonce=i))
+        blockchain.create_block()
+
+    return setup, op
+
+
+def pow_create_block_stake(args):
+    lab = load_lab("LR1-2", "lab_pow")
+    # Ключи генерируются один раз: в замер должна попадать только подпись блока
+    consensus = lab.ProofOfStake.generate({f"validator{j}": float(j + 1) for j in range(args.pow_validators)})
+
+    def setup():
+        return lab.Blockchain(consensus=consensus)
+
+    def op(blockchain, i):
+        for j in range(args.pow_transactions):
+            blockchain.new_transaction(lab.Transaction(f"sender{j}", f"recipient{i}", 1.0, nonce=i))
+        blockchain.create_block()
+
+    return setup, op
+
+
+def pow_mine(args):
+    lab = load_lab("LR1-2", "lab_pow")
+    transactions = [lab.Transaction(f"sender{j}", "recipient", 1.0) for j in range(args.pow_transactions)]
+
+    def setup():
+        return None
+
+    def op(_, i):
+        block = lab.Block(i, "0" * 64, 1_700_000_000.0 + i, transactions)
+        block.mine(args.pow_difficulty)
+
+    return setup, op
+
+
+def smr_run_consensus(args):
+    lab = load_lab("LR3-4", "lab_smr")
+
+    def setup():
+        return lab.SMRNetwork(nodes_count=args.smr_nodes)
+
+    def op(network, i):
+        network.run_consensus({"key": f"key{i % args.smr_keys}", "value": i})
+
+    return setup, op
+
+
+def _make_pos_chain(lab, args):
+    if args.pos_registry:
+        validators = lab.ValidatorRegistry()
+        validators.add_many([f"Node{i}" for i in range(args.pos_validators)], 100.0)
+        validators.add("Attacker", 100.0 * args.pos_attacker_share)
+    else:
+        validators = [lab.Validator(f"Node{i}", balance=100.0) for i in range(args.pos_validators)]
+        validators.append(lab.Validator("Attacker", balance=100.0 * args.pos_attacker_share))
+    for v in validators:
+        v.deposit_stake(50.0)
+    return lab.BlockchainPoS(validators, epoch_length=args.pos_epoch_length)
+
+
+def pos_add_block(args):
+    lab = load_lab("LR5-6", "lab_pos")
+
+    def setup():
+        return _make_pos_chain(lab, args)
+
+    def op(blockchain, i):
+        blockchain.add_block()
+
+    return setup, op
+
+
+def pos_simulate_attack(args):
+    lab = load_lab("LR5-6", "lab_pos")
+
+    def setup():
+        return _make_pos_chain(lab, args)
+
+    def op(blockchain, i):
+        blockchain.simulate_attack("Attacker", rounds=args.pos_rounds)
+
+    return setup, op
+
+
+def pos_simulate_attack_mc(args):
+    lab = load_lab("LR5-6", "lab_pos")
+
+    def setup():
+        return _make_pos_chain(lab, args)
+
+    def op(blockchain, i):
+        blockchain.simulate_attack_mc("Attacker", rounds=args.pos_rounds, trials=args.pos_trials, seed=i)
+
+    return setup, op
+
+
+WORKLOADS: Dict[str, Callable] = {
+    "pow.create_block": pow_create_block,
+    "pow.create_block_stake": pow_create_block_stake,
+    "pow.mine": pow_mine,
+    "smr.run_consensus": smr_run_consensus,
+    "pos.add_block": pos_add_block,
+    "pos.simulate_attack": pos_simulate_attack,
+    "pos.simulate_attack_mc": pos_simulate_attack_mc,
+}
+
+
+# ==============================
+# Измерения
+# ==============================
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_workload(name: str, args) -> dict:
+    setup, op = WORKLOADS[name](args)
+    # Консольный вывод лабораторных не должен попадать в замеры и отчёт
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        state = setup()
+        for i in range(args.warmup):
+            op(state, i)
+
+        state = setup()
+        latencies = []
+        started = time.perf_counter()
+        for i in range(args.ops):
+            op_started = time.perf_counter()
+            op(state, i)
+            latencies.append(time.perf_counter() - op_started)
+        elapsed = time.perf_counter() - started
+
+        # Пиковая память меряется отдельным прогоном: tracemalloc заметно замедляет код
+        peak_bytes = None
+        if not args.no_memory:
+            tracemalloc.start()
+            state = setup()
+            for i in range(args.ops):
+                op(state, i)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        "workload": name,
+        "ops": args.ops,
+        "seconds": elapsed,
+        "ops_per_sec": args.ops / elapsed if elapsed > 0 else None,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные бенчмарки всех лабораторных без GUI")
+    parser.add_argument("workloads", nargs="*", default=list(WORKLOADS),
+                        help=f"какие нагрузки запускать (по умолчанию все): {', '.join(WORKLOADS)}")
+    parser.add_argument("--ops", type=int, default=100, help="число измеряемых операций")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmark_results.jsonl"),
+                        help="файл JSON Lines, куда дописываются результаты")
+    parser.add_argument("--no-memory", action="store_true", help="не измерять пиковую память")
+    parser.add_argument("--pow-difficulty", type=int, default=3)
+    parser.add_argument("--pow-transactions", type=int, default=20, help="транзакций в блоке")
+    parser.add_argument("--pow-validators", type=int, default=10, help="валидаторов для запечатывания по стейку")
+    parser.add_argument("--smr-nodes", type=int, default=5)
+    parser.add_argument("--smr-keys", type=int, default=100)
+    parser.add_argument("--pos-validators", type=int, default=100)
+    parser.add_argument("--pos-attacker-share", type=float, default=3.0, help="баланс атакующего в долях честного")
+    parser.add_argument("--pos-rounds", type=int, default=1000, help="раундов в одной симуляции атаки")
+    parser.add_argument("--pos-registry", action="store_true", help="валидаторы в колоночном реестре")
+    parser.add_argument("--pos-epoch-length", type=int, default=None, help="блоков в эпохе (по умолчанию без эпох)")
+    parser.add_argument("--pos-trials", type=int, default=100, help="испытаний Монте-Карло за операцию")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"неизвестные нагрузки: {', '.join(unknown)}")
+
+    run_info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("workloads", "output")},
+    }
+    with open(args.output, "a") as f:
+        for name in args.workloads:
+            result = run_workload(name, args)
+            f.write(json.dumps({**run_info, **result}) + "\n")
+            memory = f"{result['peak_memory_bytes'] / 1024:.0f} КиБ" if result["peak_memory_bytes"] is not None else "-"
+            print(f"[{name:20}] {result['ops_per_sec']:10.1f} оп/с | p50 {result['p50_ms']:8.3f} мс | "
+                  f"p99 {result['p99_ms']:8.3f} мс | пик памяти {memory}")
+    print(f"[Бенчмарк] Результаты дописаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()